@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -69,6 +70,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'EEGImage.wsgi.application'
+ASGI_APPLICATION = 'EEGImage.asgi.application'
 
 
 # Database
@@ -81,6 +83,13 @@ DATABASES = {
     }
 }
 
+# Applied to every new SQLite connection (see generateImage/db.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # milliseconds
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -121,4 +130,32 @@ STATIC_URL = 'static/'
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# EEG pipeline run for each kiosk session (see generateImage/jobs.py)
+# The muselsl stream is expected to be running already (see start.sh)
+
+PIPELINE_DIR = BASE_DIR.parent / 'visualizing'
+
+PIPELINE_COMMANDS = [
+    [sys.executable, 'neurofeedback.py'],
+    [sys.executable, 'draw.py'],
+]
+
+# The pipeline steps share prompt.txt and the output image, so runs are
+# serialized by default
+PIPELINE_CONCURRENCY = 1
+
+# Longest time (in seconds) a status request may be held open
+JOB_LONG_POLL_TIMEOUT = 25
+
+# Written by visualizing/draw.py as each image stage (preview, final) lands
+IMAGE_STATUS_FILE = BASE_DIR / 'generateImage' / 'static' / 'image_status.json'
+
+# How often (in seconds) a running job checks IMAGE_STATUS_FILE
+IMAGE_STATUS_POLL_INTERVAL = 0.25
+
+# Exists while any job is queued or running; the image warm-up
+# (visualizing/warmup.py) waits for it to go away
+PIPELINE_BUSY_FILE = BASE_DIR / 'generateImage' / 'static' / 'pipeline.busy'
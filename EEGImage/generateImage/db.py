@@ -0,0 +1,18 @@
+"""
+SQLite connection tuning.
+
+Kiosks record sessions while other kiosks browse the history page, so every
+new SQLite connection is switched to WAL (readers no longer wait for writers),
+given a busy timeout (writers queue instead of failing with "database is
+locked"), and synchronous=NORMAL (no fsync per commit; safe with WAL).
+"""
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
@@ -0,0 +1,259 @@
+"""
+Asynchronous pipeline jobs.
+
+Each kiosk session submits one job that runs the EEG pipeline commands
+(recording, prompt, image generation) as subprocesses, so a single ASGI
+process can serve many kiosks without a thread per client.
+
+Jobs run on one long-lived event loop in a background thread, not on the loop
+of the request that submitted them: under WSGI (runserver) every async view
+gets a short-lived loop of its own, which would cancel the job when the
+request ends. Views on any loop can wait for a job with Job.wait().
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+FINISHED = (DONE, FAILED)
+
+# Number of finished jobs kept around for status queries
+MAX_FINISHED_JOBS = 256
+
+
+class Job:
+    def __init__(self, commands, cwd):
+        self.id = uuid.uuid4().hex
+        self.commands = commands
+        self.cwd = cwd
+        self.status = QUEUED
+        self.returncode = None
+        self.error = ''
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.image = None
+        self.version = 0
+        # Futures of the waiting views, each with the loop it belongs to
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    def set_status(self, status):
+        self.status = status
+        self.notify()
+
+    def notify(self):
+        with self._lock:
+            self.version += 1
+            waiters, self._waiters = self._waiters, set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # That request's loop is already closed
+                pass
+
+    async def wait(self, version, timeout):
+        """Wait until the job changes past "version" or "timeout" expires.
+
+        Safe to call from any event loop.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.version != version or self.status in FINISHED:
+                return
+            self._waiters.add((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard((loop, future))
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'version': self.version,
+            'returncode': self.returncode,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'image': self.image,
+        }
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_tasks = set()
+_limits = {}
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _job_loop():
+    # Started on first use and kept for the life of the process
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='pipeline-jobs',
+                             daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def _semaphore():
+    # Only used on the job loop; keyed by the limit so that a changed
+    # PIPELINE_CONCURRENCY (e.g. in tests) takes effect
+    limit = settings.PIPELINE_CONCURRENCY
+    semaphore = _limits.get(limit)
+    if semaphore is None:
+        semaphore = _limits[limit] = asyncio.Semaphore(limit)
+    return semaphore
+
+
+def _prune():
+    with _jobs_lock:
+        finished = [job for job in _jobs.values() if job.status in FINISHED]
+        finished.sort(key=lambda job: job.finished)
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del _jobs[job.id]
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+
+def active_count():
+    with _jobs_lock:
+        return sum(job.status not in FINISHED for job in _jobs.values())
+
+
+def submit(commands=None, cwd=None):
+    """Queue a pipeline run on the job loop and return its Job.
+
+    Can be called from sync or async code, in any thread.
+    """
+    if commands is None:
+        commands = settings.PIPELINE_COMMANDS
+    if cwd is None:
+        cwd = settings.PIPELINE_DIR
+    job = Job(commands, cwd)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    _prune()
+    _mark_busy(True)
+
+    _job_loop().call_soon_threadsafe(_start, job)
+    return job
+
+
+def _start(job):
+    task = asyncio.get_running_loop().create_task(_run(job))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _run(job):
+    # The pipeline steps share files (prompt.txt, the output image), so only
+    # PIPELINE_CONCURRENCY jobs run at a time; the others stay queued
+    async with _semaphore():
+        job.started = time.time()
+        _mark_busy(True)
+        job.set_status(RUNNING)
+        watcher = asyncio.get_running_loop().create_task(_watch_image(job))
+        try:
+            for command in job.commands:
+                process = await asyncio.create_subprocess_exec(
+                    *command, cwd=job.cwd,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE)
+                _, stderr = await process.communicate()
+                job.returncode = process.returncode
+                if process.returncode != 0:
+                    job.error = stderr.decode(errors='replace')[-2000:]
+                    break
+        except OSError as e:
+            job.error = str(e)
+        except asyncio.CancelledError:
+            job.error = 'cancelled'
+            raise
+        finally:
+            watcher.cancel()
+            _update_image(job)
+            job.finished = time.time()
+            failed = job.error or job.returncode not in (0, None)
+            job.status = FAILED if failed else DONE
+            # Clear the busy file before anyone waiting on the job wakes up
+            _mark_busy(active_count() > 0)
+            job.notify()
+
+
+def _mark_busy(busy):
+    # Background work outside the web app (visualizing/warmup.py) only runs
+    # while this file is absent. It is touched whenever a job is submitted,
+    # starts or finishes: warm-up ignores a busy file that has not changed
+    # for a long time (left over from a crash), and a long queue of jobs
+    # must not look like one
+    path = settings.PIPELINE_BUSY_FILE
+    try:
+        if busy:
+            path.touch()
+        else:
+            path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _read_image_status(since):
+    # draw.py replaces the file atomically; anything written before this job
+    # started belongs to an earlier session
+    try:
+        with open(settings.IMAGE_STATUS_FILE) as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if status.get('updated', 0) < since:
+        return None
+    return status
+
+
+def _update_image(job):
+    status = _read_image_status(job.started)
+    if status is not None and status != job.image:
+        job.image = status
+        job.notify()
+
+
+async def _watch_image(job):
+    # Surface each image stage (preview, then final) while the job runs, so
+    # pages can show the preview before the pipeline finishes
+    last_mtime = None
+    while True:
+        try:
+            mtime = os.stat(settings.IMAGE_STATUS_FILE).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != last_mtime:
+            last_mtime = mtime
+            _update_image(job)
+        await asyncio.sleep(settings.IMAGE_STATUS_POLL_INTERVAL)
@@ -0,0 +1,120 @@
+"""
+Measure history page latency while kiosk sessions record band powers.
+
+Runs against a throwaway database file so db.sqlite3 is left untouched:
+
+    python manage.py bench_history
+    python manage.py bench_history --row-by-row --no-tuning   # old behaviour
+"""
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.test import RequestFactory
+
+from generateImage import views
+from generateImage.models import Image, Session
+from generateImage.recording import BandPowerWriter
+
+
+class Command(BaseCommand):
+    help = 'Benchmark history page latency under concurrent session writes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=8,
+                            help='number of sessions writing concurrently')
+        parser.add_argument('--ticks', type=int, default=3000,
+                            help='band power rows written per session')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--row-by-row', action='store_true',
+                            help='commit every row on its own')
+        parser.add_argument('--no-tuning', action='store_true',
+                            help='use SQLite defaults instead of SQLITE_PRAGMAS')
+        parser.add_argument('--images', type=int, default=200,
+                            help='rows shown on the history page')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.use_database(os.path.join(tmp, 'bench.sqlite3'), options)
+            try:
+                self.run(options)
+            finally:
+                connections.close_all()
+
+    def use_database(self, path, options):
+        connections.close_all()
+        connections.settings['default']['NAME'] = path
+        if options['no_tuning']:
+            settings.SQLITE_PRAGMAS = {'journal_mode': 'DELETE'}
+        call_command('migrate', verbosity=0)
+        Image.objects.bulk_create(
+            [Image(image_url='/static/v1_txt2img.png')
+             for _ in range(options['images'])])
+
+    def run(self, options):
+        batch_size = 1 if options['row_by_row'] else options['batch_size']
+        done = threading.Event()
+        write_errors = []
+
+        def record_session(index):
+            try:
+                session = Session.objects.create(prompt='bench %d' % index)
+                with BandPowerWriter(session, batch_size=batch_size) as writer:
+                    for tick in range(options['ticks']):
+                        writer.add(tick, tick * 0.2, 0.1, 0.2, 0.3, 0.4, 0.5)
+            except OperationalError as e:
+                write_errors.append(e)
+            finally:
+                connections.close_all()
+
+        writers = [threading.Thread(target=record_session, args=(i,))
+                   for i in range(options['sessions'])]
+
+        def wait_for_writers():
+            for thread in writers:
+                thread.join()
+            done.set()
+
+        factory = RequestFactory()
+        latencies = []
+        read_errors = 0
+
+        start = time.perf_counter()
+        for thread in writers:
+            thread.start()
+        threading.Thread(target=wait_for_writers).start()
+
+        while not done.is_set():
+            t0 = time.perf_counter()
+            try:
+                views.history(factory.get('/history/'))
+            except OperationalError:
+                read_errors += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+
+        rows = options['sessions'] * options['ticks']
+        latencies_ms = sorted(1000 * t for t in latencies) or [float('nan')]
+        p95 = latencies_ms[int(0.95 * (len(latencies_ms) - 1))]
+
+        self.stdout.write('mode: %s, %s' % (
+            'row-by-row' if options['row_by_row'] else
+            'batches of %d' % batch_size,
+            'SQLite defaults' if options['no_tuning'] else
+            'tuned (%s)' % ', '.join('%s=%s' % item for item in
+                                     settings.SQLITE_PRAGMAS.items())))
+        self.stdout.write('writes: %d rows from %d sessions in %.2f s '
+                          '(%.0f rows/s), %d failed sessions' % (
+                              rows, options['sessions'], elapsed,
+                              rows / elapsed, len(write_errors)))
+        self.stdout.write('history page: %d requests, median %.1f ms, '
+                          'p95 %.1f ms, max %.1f ms, %d failed' % (
+                              len(latencies), statistics.median(latencies_ms),
+                              p95, latencies_ms[-1], read_errors))
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generateImage', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Session',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(auto_now_add=True)),
+                ('prompt', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BandPower',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tick', models.PositiveIntegerField()),
+                ('timestamp', models.FloatField()),
+                ('delta', models.FloatField()),
+                ('theta', models.FloatField()),
+                ('alpha', models.FloatField()),
+                ('beta', models.FloatField()),
+                ('relax', models.FloatField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='band_powers', to='generateImage.session')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session', 'tick'], name='generateIma_session_c76a71_idx')],
+            },
+        ),
+    ]
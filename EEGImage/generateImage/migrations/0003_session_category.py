@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generateImage', '0002_session_bandpower'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='category',
+            field=models.CharField(blank=True, max_length=8),
+        ),
+    ]
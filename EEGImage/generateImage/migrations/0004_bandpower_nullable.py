@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generateImage', '0003_session_category'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bandpower',
+            name='alpha',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='bandpower',
+            name='beta',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='bandpower',
+            name='delta',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='bandpower',
+            name='relax',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='bandpower',
+            name='theta',
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -2,4 +2,30 @@ from django.db import models
 
 # Create your models here.
 class Image(models.Model):
-    image_url = models.CharField(max_length=255)
\ No newline at end of file
+    image_url = models.CharField(max_length=255)
+
+
+class Session(models.Model):
+    started = models.DateTimeField(auto_now_add=True)
+    prompt = models.CharField(max_length=255, blank=True)
+    # Prompt category (see visualizing/prompts.py), set when the session ends
+    category = models.CharField(max_length=8, blank=True)
+
+
+class BandPower(models.Model):
+    # One row per neurofeedback tick; written in batches by
+    # recording.BandPowerWriter
+    session = models.ForeignKey(Session, on_delete=models.CASCADE,
+                                related_name='band_powers')
+    tick = models.PositiveIntegerField()
+    timestamp = models.FloatField()
+    # NULL where the tick's value was not finite (e.g. log10(0) on a flat
+    # channel), which SQLite cannot store as a float
+    delta = models.FloatField(null=True)
+    theta = models.FloatField(null=True)
+    alpha = models.FloatField(null=True)
+    beta = models.FloatField(null=True)
+    relax = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['session', 'tick'])]
@@ -0,0 +1,74 @@
+"""
+Batched persistence of per-tick band powers.
+
+A session produces several rows per second. Inserting them one by one takes
+the SQLite write lock once per row, which starves the history page and the
+other kiosks; BandPowerWriter buffers the rows and inserts them with
+bulk_create, one transaction per batch.
+"""
+import math
+
+from django.db import transaction
+
+from .models import BandPower, Session
+
+
+class BandPowerWriter:
+    def __init__(self, session, batch_size=500):
+        self.session = session
+        self.batch_size = batch_size
+        self.written = 0
+        self._pending = []
+
+    def add(self, tick, timestamp, delta, theta, alpha, beta, relax):
+        delta, theta, alpha, beta, relax = (
+            _finite_or_none(value)
+            for value in (delta, theta, alpha, beta, relax))
+        self._pending.append(BandPower(
+            session=self.session, tick=tick, timestamp=timestamp,
+            delta=delta, theta=theta, alpha=alpha, beta=beta, relax=relax))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with transaction.atomic():
+            BandPower.objects.bulk_create(self._pending,
+                                          batch_size=self.batch_size)
+        self.written += len(self._pending)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+
+    def finish(self, prompt, category):
+        """Write the remaining rows and what the session produced."""
+        self.flush()
+        self.session.prompt = prompt[:255]
+        self.session.category = category
+        self.session.save(update_fields=['prompt', 'category'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _finite_or_none(value):
+    # A flat channel gives log10(0) = -inf and a ratio of those NaN; SQLite
+    # stores NaN as NULL anyway, and infinities are no use to the history
+    return value if math.isfinite(value) else None
+
+
+def start_session(batch_size=500):
+    """Create a Session and return the writer for its band powers."""
+    return BandPowerWriter(Session.objects.create(), batch_size=batch_size)
+
+
+def recent_categories(limit=200):
+    """Prompt categories of the last "limit" finished sessions, newest first."""
+    return list(Session.objects.exclude(category='')
+                .order_by('-started', '-id')
+                .values_list('category', flat=True)[:limit])
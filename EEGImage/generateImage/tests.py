@@ -1,3 +1,271 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from django.db import connection
+from django.test import (AsyncClient, Client, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import jobs, recording
+from .models import BandPower, Session
+from .recording import BandPowerWriter
 
 # Create your tests here.
+
+# Stand-in for the EEG pipeline: takes a fixed time, touches no hardware
+PIPELINE_SECONDS = 0.5
+FAKE_PIPELINE = [[sys.executable, '-c',
+                  'import time; time.sleep(%s)' % PIPELINE_SECONDS]]
+
+
+async def child_watchers_idle(timeout=5):
+    # asyncio's threaded child watcher can outlive the processes it reported
+    # on; let it finish before the test's event loop is closed
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and any(
+            t.name.startswith('asyncio-waitpid') for t in threading.enumerate()):
+        await asyncio.sleep(0.05)
+
+
+async def wait_finished(job):
+    while job.status not in jobs.FINISHED:
+        await job.wait(job.version, 5)
+
+
+@override_settings(PIPELINE_COMMANDS=FAKE_PIPELINE, PIPELINE_CONCURRENCY=50,
+                   JOB_LONG_POLL_TIMEOUT=10)
+class PipelineJobLoadTest(SimpleTestCase):
+
+    async def run_session(self, client):
+        # Same requests a kiosk makes: start, then long-poll until done
+        response = await client.get(reverse('countdown_page'))
+        self.assertEqual(response.status_code, 200)
+        job_id = response.context['job_id']
+
+        version = -1
+        status_url = reverse('job_status', args=[job_id])
+        while True:
+            response = await client.get(status_url, {'version': version})
+            job = response.json()
+            if job['status'] in jobs.FINISHED:
+                return job
+            version = job['version']
+
+    async def test_concurrent_sessions(self):
+        n_sessions = 50
+        start = time.monotonic()
+        results = await asyncio.gather(
+            *[self.run_session(AsyncClient()) for _ in range(n_sessions)])
+        elapsed = time.monotonic() - start
+
+        self.assertEqual([job['status'] for job in results],
+                         [jobs.DONE] * n_sessions)
+        # Serving the sessions one after the other would take 25 seconds
+        self.assertLess(elapsed, n_sessions * PIPELINE_SECONDS / 5)
+        await child_watchers_idle()
+
+    @override_settings(PIPELINE_CONCURRENCY=1)
+    async def test_jobs_are_queued_beyond_concurrency(self):
+        first = jobs.submit()
+        second = jobs.submit()
+        await asyncio.sleep(0.1)
+        self.assertEqual(first.status, jobs.RUNNING)
+        self.assertEqual(second.status, jobs.QUEUED)
+        await wait_finished(first)
+        await asyncio.sleep(0.1)
+        self.assertEqual(second.status, jobs.RUNNING)
+        await wait_finished(second)
+
+    async def test_events_stream_until_finished(self):
+        job = jobs.submit()
+        response = await AsyncClient().get(
+            reverse('job_events', args=[job.id]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        statuses = []
+        async for chunk in response.streaming_content:
+            chunk = chunk.decode()
+            if chunk.startswith('data: '):
+                statuses.append(json.loads(chunk[6:])['status'])
+        self.assertEqual(statuses[-1], jobs.DONE)
+
+    def test_sessions_under_wsgi(self):
+        # runserver serves the async views through a new event loop per
+        # request; the job must outlive the request that started it
+        client = Client()
+        for _ in range(2):
+            start = time.monotonic()
+            response = client.get(reverse('countdown_page'))
+            status_url = reverse('job_status', args=[response.context['job_id']])
+
+            version = -1
+            while True:
+                job = client.get(status_url, {'version': version}).json()
+                if job['status'] in jobs.FINISHED:
+                    break
+                version = job['version']
+
+            self.assertEqual(job['status'], jobs.DONE)
+            self.assertLess(time.monotonic() - start, 5)
+
+    async def test_unknown_job(self):
+        response = await AsyncClient().get(reverse('job_status', args=['x']))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PIPELINE_COMMANDS=[[sys.executable, '-c', 'exit(3)']])
+    async def test_failed_pipeline(self):
+        job = jobs.submit()
+        await wait_finished(job)
+        self.assertEqual(job.status, jobs.FAILED)
+        self.assertEqual(job.returncode, 3)
+
+
+@override_settings(PIPELINE_COMMANDS=FAKE_PIPELINE, PIPELINE_CONCURRENCY=1)
+class BusyFileTest(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.busy_file = pathlib.Path(tmp) / 'pipeline.busy'
+
+    async def test_busy_while_any_job_is_active(self):
+        with self.settings(PIPELINE_BUSY_FILE=self.busy_file):
+            first = jobs.submit()
+            second = jobs.submit()
+            self.assertTrue(self.busy_file.exists())
+            await wait_finished(first)
+            # The second job is still to run
+            self.assertTrue(self.busy_file.exists())
+            await wait_finished(second)
+            self.assertFalse(self.busy_file.exists())
+            await child_watchers_idle()
+
+    async def test_busy_file_is_refreshed_by_queued_jobs(self):
+        with self.settings(PIPELINE_BUSY_FILE=self.busy_file):
+            first = jobs.submit()
+            second = jobs.submit()
+            while first.status != jobs.RUNNING:
+                await first.wait(first.version, 5)
+            # As if the queue had been running for an hour
+            stale = time.time() - 3600
+            os.utime(self.busy_file, (stale, stale))
+            await wait_finished(first)
+            # Fresh again for the job that is still to run
+            self.assertGreater(self.busy_file.stat().st_mtime, stale + 3000)
+            await wait_finished(second)
+            await child_watchers_idle()
+
+
+# Stand-in for draw.py: publishes a preview, then the final image
+FAKE_DRAW = """
+import json, os, sys, time
+def stage(name, image):
+    tmp = sys.argv[1] + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'stage': name, 'image': image, 'updated': time.time()}, f)
+    os.replace(tmp, sys.argv[1])
+stage('preview', 'preview.png')
+time.sleep(0.5)
+stage('final', 'final.png')
+"""
+
+
+class ImageStageTest(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.status_file = os.path.join(tmp, 'image_status.json')
+        # A leftover status from an earlier session must be ignored
+        with open(self.status_file, 'w') as f:
+            json.dump({'stage': 'final', 'image': 'old.png', 'updated': 0}, f)
+
+    async def test_preview_then_final(self):
+        with self.settings(IMAGE_STATUS_FILE=self.status_file,
+                           IMAGE_STATUS_POLL_INTERVAL=0.05,
+                           PIPELINE_COMMANDS=[[sys.executable, '-c', FAKE_DRAW,
+                                               self.status_file]]):
+            job = jobs.submit()
+            client = AsyncClient()
+            status_url = reverse('job_status', args=[job.id])
+
+            stages = []
+            version = -1
+            while True:
+                response = await client.get(status_url, {'version': version})
+                payload = response.json()
+                if payload['image'] and (not stages or
+                                         stages[-1] != payload['image']['stage']):
+                    stages.append(payload['image']['stage'])
+                if payload['status'] in jobs.FINISHED:
+                    break
+                version = payload['version']
+
+            self.assertEqual(stages, ['preview', 'final'])
+
+            response = await client.get(reverse('image_display'),
+                                        {'job': job.id})
+            self.assertContains(response, 'final.png?v=')
+
+
+class SQLiteTuningTest(TestCase):
+
+    def test_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+
+class BandPowerWriterTest(TestCase):
+
+    def test_rows_are_written_in_batches(self):
+        session = Session.objects.create()
+        with CaptureQueriesContext(connection) as queries:
+            with BandPowerWriter(session, batch_size=100) as writer:
+                for tick in range(250):
+                    writer.add(tick, tick * 0.2, 0.1, 0.2, 0.3, 0.4, 0.5)
+                # Only the full batches have been written so far
+                self.assertEqual(BandPower.objects.count(), 200)
+
+        inserts = [q for q in queries.captured_queries
+                   if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(writer.written, 250)
+        self.assertEqual(
+            list(session.band_powers.order_by('tick')
+                 .values_list('tick', flat=True)), list(range(250)))
+
+    def test_finished_sessions_feed_recent_categories(self):
+        for category in ['110', '001', '110']:
+            writer = recording.start_session()
+            writer.add(0, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5)
+            writer.finish('a prompt', category)
+        # Still recording: no category yet
+        recording.start_session().add(0, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5)
+
+        self.assertEqual(recording.recent_categories(), ['110', '001', '110'])
+        self.assertEqual(recording.recent_categories(limit=1), ['110'])
+        self.assertEqual(BandPower.objects.count(), 3)
+
+    def test_non_finite_values_are_stored_as_null(self):
+        # A flat channel: every band is log10(0), the relax ratio NaN
+        writer = recording.start_session()
+        inf = float('inf')
+        writer.add(0, 0.0, -inf, -inf, -inf, -inf, float('nan'))
+        writer.add(1, 0.2, 0.1, 0.2, 0.3, 0.4, 0.5)
+        writer.finish('a prompt', '000')
+
+        rows = list(writer.session.band_powers.order_by('tick').values_list(
+            'delta', 'theta', 'alpha', 'beta', 'relax'))
+        self.assertEqual(rows, [(None,) * 5, (0.1, 0.2, 0.3, 0.4, 0.5)])
+        self.assertEqual(recording.recent_categories(), ['000'])
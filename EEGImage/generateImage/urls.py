@@ -8,6 +8,8 @@ urlpatterns = [
     path('countdown/', views.countdown_page, name='countdown_page'),
     path('image_display/', views.image_display, name='image_display'),
     path('image_processing/', views.image_processing, name='image_processing'),
+    path('jobs/<str:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<str:job_id>/events/', views.job_events, name='job_events'),
 
     path('history/', views.history, name='history'),
 ]
\ No newline at end of file
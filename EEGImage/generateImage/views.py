@@ -1,9 +1,11 @@
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         JsonResponse, StreamingHttpResponse)
 from django.template import loader
 from django.shortcuts import render
 from .models import Image
-import subprocess
+from . import jobs
+import json
 import os
 import random
 import time
@@ -36,14 +38,14 @@ import requests
 def start_page(request):
     return render(request, 'start_page.html')
 
-def countdown_page(request):
+async def countdown_page(request):
     # Simulate a 5-second countdown
     # for i in range(5, 0, -1):
     #     time.sleep(1)
 
-    command = 'cd ../visualizing; ./start.sh'
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                               universal_newlines=True)
+    # Start the EEG pipeline without blocking the worker; the pages that
+    # follow track it through job_status
+    job = jobs.submit()
 
     path = '~/EEGImage/EEGImage/generateImage/static/cur_img.txt'
     expanded = os.path.expanduser(path)
@@ -52,19 +54,75 @@ def countdown_page(request):
     # Generate a random image (replace this with your logic)
 
 
-    return render(request, 'countdown_page.html')
+    return render(request, 'countdown_page.html', {'job_id': job.id})
 
-def image_processing(request):
-    return render(request, 'image_processing.html')
+async def image_processing(request):
+    return render(request, 'image_processing.html',
+                  {'job_id': request.GET.get('job', '')})
 
 
-def image_display(request):
+async def job_status(request, job_id):
+    # Long-poll: with ?version=N the response is held until the job moves
+    # past version N, or for at most JOB_LONG_POLL_TIMEOUT seconds
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise Http404('Unknown job')
+
+    if 'version' in request.GET:
+        try:
+            version = int(request.GET['version'])
+            wait = float(request.GET.get('wait', settings.JOB_LONG_POLL_TIMEOUT))
+        except ValueError:
+            return HttpResponseBadRequest('version and wait must be numbers')
+        await job.wait(version, max(min(wait, settings.JOB_LONG_POLL_TIMEOUT), 0))
+
+    return JsonResponse(job.as_dict())
+
+
+async def job_events(request, job_id):
+    # Server-sent events: one message per status change, until the job ends
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise Http404('Unknown job')
+
+    async def events():
+        version = None
+        while True:
+            if job.version != version:
+                version = job.version
+                yield 'data: %s\n\n' % json.dumps(job.as_dict())
+                if job.status in jobs.FINISHED:
+                    return
+            else:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+            await job.wait(version, settings.JOB_LONG_POLL_TIMEOUT)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+async def image_display(request):
     # image_url = "{% static 'v1_txt2img.png' %}"  # Example URL
     #
     # # add to database
     # image = Image(image_url=image_url)
     # image.save()
-    return render(request, 'image_display.html')#, {'random_image_url': image_url})
+
+    # Show whichever stage of this session's image is available; the page
+    # swaps in the final render when it lands
+    job_id = request.GET.get('job', '')
+    job = jobs.get_job(job_id)
+    image = job.image if job is not None else None
+    if image is None or not image.get('image'):
+        image = {'stage': 'final', 'image': 'v1_txt2img.png', 'updated': 0}
+    context = {
+        'job_id': job_id if job is not None else '',
+        'job_version': job.version if job is not None else -1,
+        'image': image,
+    }
+    return render(request, 'image_display.html', context)
 
 
 def history(request):
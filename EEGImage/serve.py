@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+"""Serve the project over ASGI with uvicorn.
+
+Pipeline jobs are tracked in memory (generateImage/jobs.py), so the server
+runs as a single process; its event loop keeps the long-poll and
+server-sent-event connections of every kiosk open without a thread each.
+"""
+import os
+
+import uvicorn
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EEGImage.settings')
+    uvicorn.run(
+        'EEGImage.asgi:application',
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', '8000')),
+        # Must stay at 1: jobs are not shared between processes
+        workers=1,
+        # Long-polls last up to JOB_LONG_POLL_TIMEOUT; keep idle
+        # connections around a little longer than that
+        timeout_keep_alive=30,
+        limit_concurrency=int(os.environ.get('MAX_CONNECTIONS', '1000')),
+        log_level=os.environ.get('LOG_LEVEL', 'info'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded-Latency EEG Acquisition
+
+These functions and classes pull chunks from an LSL inlet without blocking the
+processing loop, and turn the irregular, possibly lossy stream coming over
+Bluetooth into evenly spaced samples that the FFT in utils.py can rely on.
+
+"""
+
+import numpy as np
+
+
+# numpy dtypes matching the LSL channel formats (see pylsl.cf_*)
+LSL_DTYPES = {
+    1: np.float32,  # cf_float32
+    2: np.float64,  # cf_double64
+    4: np.int32,    # cf_int32
+    5: np.int16,    # cf_int16
+    6: np.int8,     # cf_int8
+    7: np.int64,    # cf_int64
+}
+
+
+def resample_chunk(data, timestamps, fs, last_timestamp=None,
+                   last_sample=None, max_gap=1.0):
+    """Place a chunk of samples on a uniform time grid.
+
+    Dropped samples show up as a jump in the LSL timestamps, and clock jitter
+    as uneven spacing between them. Both are corrected by linearly
+    interpolating the chunk onto a grid of period 1 / fs that continues from
+    the last sample emitted. Gaps longer than "max_gap" seconds are not
+    bridged: the grid restarts at the first timestamp of the chunk instead.
+
+    Args:
+        data (numpy.ndarray): samples of shape [n_samples, n_channels]
+        timestamps (numpy.ndarray): LSL timestamp of each sample (seconds)
+        fs (float): nominal sampling frequency
+        last_timestamp (float): grid time of the last sample emitted, or None
+            if this is the first chunk
+        last_sample (numpy.ndarray): last sample emitted [n_channels], or None
+        max_gap (float): longest gap (in seconds) that will be interpolated
+
+    Returns:
+        (numpy.ndarray): resampled data of shape [n_out, n_channels]
+        (float): grid time of the last sample in the output (unchanged if the
+            output is empty)
+        (int): number of samples that were missing and had to be filled
+    """
+    period = 1.0 / fs
+    n_channels = data.shape[1]
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+
+    # np.interp needs increasing sample points; LSL may repeat a timestamp
+    # when a chunk arrives without per-sample stamps
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order]
+    data = data[order]
+
+    if last_timestamp is not None:
+        if timestamps[-1] < last_timestamp - max_gap:
+            # The stream clock went backwards (e.g. the headset reconnected)
+            last_timestamp = None
+        else:
+            # Drop samples that were already covered by the previous chunk
+            keep = timestamps > last_timestamp
+            if not keep.any():
+                return (np.empty((0, n_channels), dtype=np.float64),
+                        last_timestamp, 0)
+            timestamps = timestamps[keep]
+            data = data[keep]
+
+    bridge = (last_timestamp is not None and last_sample is not None and
+              timestamps[0] - last_timestamp <= max_gap)
+    if bridge:
+        start = last_timestamp + period
+        xp = np.concatenate(([last_timestamp], timestamps))
+        fp = np.concatenate((last_sample.reshape(1, n_channels), data), axis=0)
+    else:
+        start = timestamps[0]
+        xp = timestamps
+        fp = data
+
+    n_out = int(np.floor((timestamps[-1] - start) / period + 0.5)) + 1
+    if n_out <= 0:
+        # The chunk ends less than half a period after the last sample
+        return (np.empty((0, n_channels), dtype=np.float64),
+                last_timestamp, 0)
+
+    grid = start + np.arange(n_out) * period
+    out = np.empty((n_out, n_channels), dtype=np.float64)
+    for ch in range(n_channels):
+        out[:, ch] = np.interp(grid, xp, fp[:, ch])
+
+    n_missing = max(n_out - data.shape[0], 0)
+
+    return out, grid[-1], n_missing
+
+
+class LocalStreamInfo:
+    """The parts of pylsl.StreamInfo that the pipeline reads, for sources
+    that are not LSL streams (synthetic.FakeInlet, shared_ring.RingReader).
+    """
+
+    def __init__(self, fs, n_channels, name, source_id, channel_format=1):
+        self._fs = fs
+        self._n_channels = n_channels
+        self._name = name
+        self._source_id = source_id
+        self._channel_format = channel_format
+
+    def name(self):
+        return self._name
+
+    def type(self):
+        return 'EEG'
+
+    def nominal_srate(self):
+        return float(self._fs)
+
+    def channel_count(self):
+        return self._n_channels
+
+    def channel_format(self):
+        # pylsl.cf_float32 by default, as sent by muselsl
+        return self._channel_format
+
+    def source_id(self):
+        return self._source_id
+
+    def desc(self):
+        return None
+
+
+class ChunkReader:
+    """Pull EEG chunks from an LSL inlet with a bounded wait.
+
+    Samples are pulled into a preallocated buffer (pull_chunk's "dest_obj"),
+    stamped with the inlet's clock offset, and resampled onto a uniform grid
+    so that packets lost over Bluetooth do not shift the band powers.
+
+    Args:
+        inlet (pylsl.StreamInlet): inlet to read from; anything providing
+            info(), time_correction() and pull_chunk() will do
+        max_samples (int): largest chunk pulled per call
+        timeout (float): longest time (in seconds) a call may wait for data;
+            0 makes every call non-blocking
+        max_gap (float): longest gap (in seconds) that will be interpolated
+        correction_interval (float): how often (in seconds) the clock offset
+            is refreshed
+    """
+
+    def __init__(self, inlet, max_samples, timeout=0.0, max_gap=1.0,
+                 correction_interval=5.0):
+        self.inlet = inlet
+        self.max_samples = int(max_samples)
+        self.timeout = timeout
+        self.max_gap = max_gap
+        self.correction_interval = correction_interval
+
+        info = inlet.info()
+        self.fs = float(info.nominal_srate())
+        self.n_channels = int(info.channel_count())
+        dtype = LSL_DTYPES.get(info.channel_format(), np.float32)
+        self._dest = np.zeros((self.max_samples, self.n_channels), dtype=dtype)
+
+        self.time_correction = inlet.time_correction()
+        self._correction_due = self.correction_interval
+
+        self.last_timestamp = None
+        self.last_sample = None
+        self.n_missing = 0
+        self.n_received = 0
+
+    def _refresh_time_correction(self, now):
+        if self.correction_interval is None or now < self._correction_due:
+            return
+        try:
+            self.time_correction = self.inlet.time_correction(timeout=0.0)
+        except Exception:
+            # Keep the last estimate; a failed update must not stall a tick
+            pass
+        self._correction_due = now + self.correction_interval
+
+    def read(self):
+        """Pull the samples available now, waiting at most "timeout".
+
+        Returns:
+            (numpy.ndarray): evenly spaced samples of shape
+                [n_samples, n_channels]; empty when nothing arrived
+            (numpy.ndarray): grid timestamps of the returned samples, in the
+                local clock
+        """
+        _, timestamps = self.inlet.pull_chunk(
+            timeout=self.timeout, max_samples=self.max_samples,
+            dest_obj=self._dest)
+        n_samples = len(timestamps)
+        if n_samples == 0:
+            return (np.empty((0, self.n_channels), dtype=np.float64),
+                    np.empty(0, dtype=np.float64))
+        self.n_received += n_samples
+
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        self._refresh_time_correction(timestamps[-1])
+        timestamps = timestamps + self.time_correction
+
+        data, last_timestamp, n_missing = resample_chunk(
+            self._dest[:n_samples], timestamps, self.fs,
+            last_timestamp=self.last_timestamp,
+            last_sample=self.last_sample, max_gap=self.max_gap)
+        self.n_missing += n_missing
+
+        if data.shape[0] == 0:
+            return data, np.empty(0, dtype=np.float64)
+
+        grid = last_timestamp - np.arange(data.shape[0])[::-1] / self.fs
+        self.last_timestamp = last_timestamp
+        self.last_sample = data[-1].copy()
+
+        return data, grid
+
+
+class TickCounter:
+    """Decide when enough new samples have arrived for the next tick.
+
+    Pulls are kept short to bound latency, so one pull usually returns a
+    single Bluetooth packet rather than a whole epoch shift. Counting samples
+    instead of pulls keeps the tick rate, and with it the time span of
+    anything averaged over ticks, independent of how the stream is chunked.
+
+    Args:
+        shift (int): number of new samples per tick
+    """
+
+    def __init__(self, shift):
+        self.shift = int(shift)
+        self.pending = 0
+
+    def add(self, n_samples):
+        """Count "n_samples" new samples; True if a tick is due."""
+        self.pending += n_samples
+        if self.pending < self.shift:
+            return False
+        # After a stall, tick once instead of catching up on every shift
+        self.pending %= self.shift
+        return True
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Session-Level Aggregation of Band Powers
+
+These classes collect the per-tick neurofeedback features of a session,
+reject ticks contaminated by artifacts (blinks, jaw clenches, electrode pops,
+zero-power bands) and reduce what is left to robust summaries.
+
+BandPowerSeries keeps the whole session and summarizes it at the end;
+OnlineBandSummary keeps the same summaries up to date tick by tick, in
+constant memory.
+
+"""
+
+import numpy as np
+
+
+# Columns of the feature rows
+FEATURES = ('delta', 'theta', 'alpha', 'beta', 'relax')
+DELTA, THETA, ALPHA, BETA, RELAX = range(len(FEATURES))
+
+# Scale factor turning a median absolute deviation into a standard deviation
+# for normally distributed data (Iglewicz and Hoaglin's modified z-score)
+MAD_TO_SIGMA = 1.4826
+
+
+class BandPowerSeries:
+    """Per-tick features of one session, stored in a preallocated array.
+
+    Args:
+        n_features (int): number of features per tick
+        capacity (int): number of ticks preallocated; the array doubles in
+            size if a session runs longer
+        max_ptp (float): ticks whose raw epoch peak-to-peak amplitude exceeds
+            this (in the units of the EEG, uV for the Muse) are rejected;
+            None disables the check
+        max_var (float): same for the variance of the raw epoch
+        z_threshold (float): ticks with a feature further than this many
+            robust standard deviations from the session median are rejected
+        trim (float): fraction cut from each end for the trimmed mean
+    """
+
+    def __init__(self, n_features=len(FEATURES), capacity=256, max_ptp=None,
+                 max_var=None, z_threshold=3.5, trim=0.1):
+        self.n_features = n_features
+        self.max_ptp = max_ptp
+        self.max_var = max_var
+        self.z_threshold = z_threshold
+        self.trim = trim
+
+        self._values = np.zeros((capacity, n_features))
+        self._ptp = np.zeros(capacity)
+        self._var = np.zeros(capacity)
+        self.n_ticks = 0
+
+    def __len__(self):
+        return self.n_ticks
+
+    @property
+    def values(self):
+        """(numpy.ndarray): features recorded so far [n_ticks, n_features]"""
+        return self._values[:self.n_ticks]
+
+    def _grow(self):
+        n = self.n_ticks
+        values = np.zeros((2 * n, self.n_features))
+        values[:n] = self._values
+        ptp, var = np.zeros(2 * n), np.zeros(2 * n)
+        ptp[:n], var[:n] = self._ptp, self._var
+        self._values, self._ptp, self._var = values, ptp, var
+
+    def append(self, features, ptp=0.0, var=0.0):
+        """Record one tick.
+
+        Args:
+            features (array-like): feature values, in FEATURES order
+            ptp (float): peak-to-peak amplitude of the raw epoch
+            var (float): variance of the raw epoch
+        """
+        if self.n_ticks == self._values.shape[0]:
+            self._grow()
+        self._values[self.n_ticks] = features
+        self._ptp[self.n_ticks] = ptp
+        self._var[self.n_ticks] = var
+        self.n_ticks += 1
+
+    def clean_mask(self):
+        """Flag the ticks that pass artifact rejection.
+
+        A tick is rejected if any feature is not finite (e.g. log10 of a zero
+        power band), if its raw epoch exceeds the amplitude or variance
+        threshold, or if any feature has a robust z-score above z_threshold.
+
+        Returns:
+            (numpy.ndarray): boolean mask of shape [n_ticks]
+        """
+        n = self.n_ticks
+        x = self._values[:n]
+
+        keep = np.isfinite(x).all(axis=1)
+        if self.max_ptp is not None:
+            keep &= self._ptp[:n] <= self.max_ptp
+        if self.max_var is not None:
+            keep &= self._var[:n] <= self.max_var
+        if self.z_threshold is None or not keep.any():
+            return keep
+
+        median = np.median(x[keep], axis=0)
+        sigma = MAD_TO_SIGMA * np.median(np.abs(x[keep] - median), axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = np.abs(x - median) / sigma
+        # A feature that did not vary at all cannot flag outliers
+        z[:, sigma == 0] = 0
+        keep &= (z <= self.z_threshold).all(axis=1)
+
+        return keep
+
+    def summarize(self):
+        """Reduce the clean ticks to robust session summaries.
+
+        Returns:
+            (dict): 'median', 'trimmed_mean' and 'mean' (numpy.ndarray of
+                shape [n_features], NaN if no tick survived), 'n_kept' and
+                'n_rejected'
+        """
+        keep = self.clean_mask()
+        n_kept = int(keep.sum())
+
+        summary = {'n_kept': n_kept, 'n_rejected': self.n_ticks - n_kept}
+        if n_kept == 0:
+            nan = np.full(self.n_features, np.nan)
+            summary.update(median=nan, trimmed_mean=nan.copy(),
+                           mean=nan.copy())
+            return summary
+
+        # One sort per feature gives the median and the trimmed mean
+        ordered = np.sort(self._values[:self.n_ticks][keep], axis=0)
+        half = n_kept // 2
+        if n_kept % 2:
+            median = ordered[half]
+        else:
+            median = (ordered[half - 1] + ordered[half]) / 2
+        cut = int(self.trim * n_kept)
+
+        summary.update(median=median,
+                       trimmed_mean=ordered[cut:n_kept - cut].mean(axis=0),
+                       mean=ordered.mean(axis=0))
+        return summary
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile for several features at once.
+
+    Implements the P-square algorithm (Jain and Chlamtac, 1985): five markers
+    per feature track the quantile in constant memory and time per update.
+
+    Args:
+        p (float): quantile to track, between 0 and 1
+        n_features (int): number of features updated together
+    """
+
+    def __init__(self, p, n_features):
+        self.p = p
+        self.count = 0
+        self._q = np.zeros((5, n_features))
+        self._n = np.tile(np.arange(5, dtype=float)[:, np.newaxis],
+                          (1, n_features))
+        self._desired = np.array([0, 2 * p, 4 * p, 2 + 2 * p, 4])
+        self._increment = np.array([0, p / 2, p, (1 + p) / 2, 1])
+
+    def update(self, x):
+        """Add one observation per feature (numpy.ndarray [n_features])."""
+        q, n = self._q, self._n
+        if self.count < 5:
+            q[self.count] = x
+            self.count += 1
+            if self.count == 5:
+                q.sort(axis=0)
+            return
+        self.count += 1
+
+        # Cell k in 0..3 such that q[k] <= x < q[k + 1], extending the
+        # extreme markers if x falls outside them
+        np.minimum(q[0], x, out=q[0])
+        np.maximum(q[4], x, out=q[4])
+        k = np.clip((x >= q[1:4]).sum(axis=0), 0, 3)
+        n += np.arange(5)[:, np.newaxis] > k[np.newaxis, :]
+        self._desired += self._increment
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in (1, 2, 3):
+                d = self._desired[i] - n[i]
+                move = (((d >= 1) & (n[i + 1] - n[i] > 1)) |
+                        ((d <= -1) & (n[i - 1] - n[i] < -1)))
+                if not move.any():
+                    continue
+                s = np.sign(d)
+                parabolic = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) /
+                    (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) /
+                    (n[i] - n[i - 1]))
+                neighbour = np.where(s > 0, i + 1, i - 1)
+                cols = np.arange(q.shape[1])
+                linear = q[i] + s * (q[neighbour, cols] - q[i]) / (
+                    n[neighbour, cols] - n[i])
+                inside = (q[i - 1] < parabolic) & (parabolic < q[i + 1])
+                estimate = np.where(inside, parabolic, linear)
+                q[i] = np.where(move, estimate, q[i])
+                n[i] = np.where(move, n[i] + s, n[i])
+
+    @property
+    def value(self):
+        """(numpy.ndarray): current estimate, NaN before any update"""
+        if self.count == 0:
+            return np.full(self._q.shape[1], np.nan)
+        if self.count < 5:
+            return np.quantile(self._q[:self.count], self.p, axis=0)
+        return self._q[2].copy()
+
+
+class OnlineBandSummary:
+    """Streaming counterpart of BandPowerSeries.summarize.
+
+    Each tick is checked against the amplitude thresholds and against the
+    running median and interquartile range, then folded into streaming
+    estimates of the median and of the trimmed mean. Memory and time per
+    tick are constant, so the summary can be read at any point of a session.
+
+    Args:
+        n_features (int): number of features per tick
+        max_ptp (float): see BandPowerSeries
+        max_var (float): see BandPowerSeries
+        z_threshold (float): see BandPowerSeries
+        trim (float): see BandPowerSeries
+        warmup (int): number of clean ticks accepted before the z-score test
+            is applied
+    """
+
+    # Scale factor turning an interquartile range into a standard deviation
+    # for normally distributed data
+    IQR_TO_SIGMA = 1 / 1.349
+
+    def __init__(self, n_features=len(FEATURES), max_ptp=None, max_var=None,
+                 z_threshold=3.5, trim=0.1, warmup=10):
+        self.n_features = n_features
+        self.max_ptp = max_ptp
+        self.max_var = max_var
+        self.z_threshold = z_threshold
+        self.trim = trim
+        self.warmup = warmup
+
+        self._median = P2Quantile(0.5, n_features)
+        self._lower_quartile = P2Quantile(0.25, n_features)
+        self._upper_quartile = P2Quantile(0.75, n_features)
+        self._lower_cut = P2Quantile(trim, n_features)
+        self._upper_cut = P2Quantile(1 - trim, n_features)
+
+        self._trimmed_sum = np.zeros(n_features)
+        self._trimmed_count = np.zeros(n_features)
+        self.n_kept = 0
+        self.n_rejected = 0
+
+    def update(self, features, ptp=0.0, var=0.0):
+        """Add one tick; returns False if it was rejected as an artifact."""
+        x = np.asarray(features, dtype=float)
+
+        clean = bool(np.isfinite(x).all())
+        if self.max_ptp is not None and ptp > self.max_ptp:
+            clean = False
+        if self.max_var is not None and var > self.max_var:
+            clean = False
+        if clean and self.z_threshold is not None and self.n_kept >= self.warmup:
+            sigma = self.IQR_TO_SIGMA * (self._upper_quartile.value -
+                                         self._lower_quartile.value)
+            deviation = np.abs(x - self._median.value)
+            clean = bool(np.all((deviation <= self.z_threshold * sigma) |
+                                (sigma == 0)))
+        if not clean:
+            self.n_rejected += 1
+            return False
+
+        for estimator in (self._median, self._lower_quartile,
+                          self._upper_quartile, self._lower_cut,
+                          self._upper_cut):
+            estimator.update(x)
+        self.n_kept += 1
+
+        # Values inside the current trimming bounds feed the trimmed mean
+        inside = ((x >= self._lower_cut.value) & (x <= self._upper_cut.value))
+        self._trimmed_sum += np.where(inside, x, 0)
+        self._trimmed_count += inside
+
+        return True
+
+    def summarize(self):
+        """Current summaries, in the same format as BandPowerSeries.summarize
+        (without 'mean')."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trimmed_mean = np.where(self._trimmed_count > 0,
+                                    self._trimmed_sum / self._trimmed_count,
+                                    np.nan)
+        return {'median': self._median.value, 'trimmed_mean': trimmed_mean,
+                'n_kept': self.n_kept, 'n_rejected': self.n_rejected}
@@ -0,0 +1,43 @@
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import draw
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Answers like the Stability text-to-image endpoint; the "image" is the
+    # prompt itself, so tests can tell which request produced it. Answers
+    # for an engine in "server.delays" are held back that many seconds.
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['text_prompts'][0]['text']
+        self.server.requests.append((self.path, body['width'], prompt))
+        engine = self.path.split('/')[3]
+        time.sleep(self.server.delays.get(engine, 0))
+        payload = json.dumps({'artifacts': [
+            {'base64': base64.b64encode(prompt.encode()).decode()}]})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(payload.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.delays = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(draw, 'api_host', 'http://127.0.0.1:%d' % server.server_port)
+    yield server
+    server.shutdown()
+    server.server_close()
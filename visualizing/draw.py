@@ -1,54 +1,172 @@
 import base64
+import json
 import os
 import requests
-import random
+import threading
+import time
+
+import prompts
+import warmup
 
 engine_id = "stable-diffusion-xl-1024-v1-0"
 api_host = os.getenv('API_HOST', 'https://api.stability.ai')
 api_key = os.getenv("STABILITY_API_KEY")
 
-if api_key is None:
-    print("Missing Stability API key. using mine")
-
-path = '~/EEGImage/EEGImage/generateImage/static/prompt.txt'
-expanded = os.path.expanduser(path)
-with open(expanded, 'r') as f:
-    prompt = f.readline()
-
-response = requests.post(
-    f"{api_host}/v1/generation/{engine_id}/text-to-image",
-    headers={
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    },
-    json={
-        "text_prompts": [
-            {
-                "text": prompt
-            }
-        ],
-        "cfg_scale": 7,
-        "height": 1024,
-        "width": 1024,
-        "samples": 1,
-        "steps": 30,
-    },
-)
-
-if response.status_code != 200:
-    raise Exception("Non-200 response: " + str(response.text))
-
-data = response.json()
-
-r1 = str(random.randint(0, 112200))
+# Cheap first pass shown while the full render is still running
+# Set DRAW_PREVIEW=0 to only request the full render
+preview_enabled = os.getenv('DRAW_PREVIEW', '1') != '0'
+preview_engine_id = os.getenv('PREVIEW_ENGINE', 'stable-diffusion-v1-6')
+preview_size = int(os.getenv('PREVIEW_SIZE', '512'))
+preview_steps = int(os.getenv('PREVIEW_STEPS', '10'))
+
+# Longest wait (in seconds) for the API to answer; a stalled request fails
+# instead of holding up the pipeline
+request_timeout = float(os.getenv('DRAW_TIMEOUT', '120'))
+preview_timeout = float(os.getenv('PREVIEW_TIMEOUT', '30'))
 
 path2 = '~/EEGImage/EEGImage/generateImage/static/'
 expanded2 = os.path.expanduser(path2)
 
-for i, image in enumerate(data["artifacts"]):
-    with open(expanded2+"v1_txt2img.png", "wb") as f:
-        f.write(base64.b64decode(image["base64"]))
+FINAL_IMAGE = "v1_txt2img.png"
+PREVIEW_IMAGE = "v1_txt2img_preview.png"
+# Read by the web app to find out which stage is available
+STATUS_FILE = "image_status.json"
+
+
+def text_to_image(prompt, engine, width, height, steps, timeout=None):
+    """Request one image from the Stability API and return the PNG bytes."""
+    if timeout is None:
+        timeout = request_timeout
+    response = requests.post(
+        f"{api_host}/v1/generation/{engine}/text-to-image",
+        headers={
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        },
+        json={
+            "text_prompts": [
+                {
+                    "text": prompt
+                }
+            ],
+            "cfg_scale": 7,
+            "height": height,
+            "width": width,
+            "samples": 1,
+            "steps": steps,
+        },
+        timeout=timeout,
+    )
+
+    if response.status_code != 200:
+        raise Exception("Non-200 response: " + str(response.text))
+
+    data = response.json()
+    return base64.b64decode(data["artifacts"][0]["base64"])
+
+
+def write_atomic(name, data):
+    # Write next to the target and rename, so the web app never serves a
+    # half-written file
+    tmp = os.path.join(expanded2, "." + name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(expanded2, name))
+
+
+def write_status(stage, image=None):
+    status = {"stage": stage, "image": image, "updated": time.time()}
+    write_atomic(STATUS_FILE, json.dumps(status).encode())
+
+
+def generate(prompt, category=None, cache=None):
+    """Render the prompt, publishing a low-resolution preview first.
+
+    Both requests are sent at once; the preview is published only if it
+    arrives before the full render, and the full render never waits for
+    the preview. If the warm-up cache already holds an
+    image of the prompt's category, that image is published instead and
+    nothing is rendered.
+
+    Returns:
+        (str): the prompt of the published image
+    """
+    if category is not None:
+        if cache is None:
+            cache = warmup.ImageCache()
+        cached_prompt = cache.take(category, os.path.join(expanded2, FINAL_IMAGE))
+        if cached_prompt is not None:
+            write_status("final", FINAL_IMAGE)
+            return cached_prompt
+
+    write_status("pending")
+    stage = _Stage()
+
+    if preview_enabled:
+        # Daemon thread: a slow preview must not keep the script alive once
+        # the full render is out
+        threading.Thread(target=_publish_preview, args=(prompt, stage),
+                         daemon=True).start()
+
+    try:
+        image = text_to_image(prompt, engine_id, 1024, 1024, 30)
+    except Exception:
+        stage.publish("failed")
+        raise
+
+    write_atomic(FINAL_IMAGE, image)
+    stage.publish("final", FINAL_IMAGE)
+    return prompt
+
+
+class _Stage:
+    # Serializes the status writes of the preview thread and the main
+    # thread, so a late preview never replaces the final image
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.finished = False
+
+    def publish(self, stage, image=None, data=None):
+        with self._lock:
+            if self.finished:
+                return
+            if data is not None:
+                write_atomic(image, data)
+            write_status(stage, image)
+            self.finished = stage != "preview"
+
+
+def _publish_preview(prompt, stage):
+    try:
+        image = text_to_image(prompt, preview_engine_id, preview_size,
+                              preview_size, preview_steps,
+                              timeout=preview_timeout)
+    except Exception as e:
+        # The full render is still coming; a failed preview only costs the
+        # early look
+        print("Preview failed: " + str(e))
+        return
+    stage.publish("preview", PREVIEW_IMAGE, image)
+
+
+if __name__ == "__main__":
+    if api_key is None:
+        print("Missing Stability API key. using mine")
 
+    path = '~/EEGImage/EEGImage/generateImage/static/prompt.txt'
+    expanded = os.path.expanduser(path)
+    with open(expanded, 'r') as f:
+        prompt = f.readline()
 
+    try:
+        with open(os.path.join(expanded2, prompts.CATEGORY_FILE)) as f:
+            category = f.read().strip() or None
+    except FileNotFoundError:
+        category = None
 
+    shown = generate(prompt, category)
+    if shown != prompt:
+        # Served from the warm-up cache: keep prompt.txt true to the image
+        with open(expanded, 'w') as f:
+            f.write(shown)
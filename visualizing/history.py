@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Session History in the Web App's Database
+
+Sessions and their per-tick band powers are stored through the web app's
+models (generateImage.models.Session and BandPower), so the pipeline scripts
+and the history page share one store. This module sets up Django for scripts
+that run outside the web app, such as neurofeedback.py and warmup.py.
+
+"""
+
+import os
+import sys
+
+
+WEB_APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, 'EEGImage')
+
+
+def setup():
+    """Configure Django with the web app's settings (once per process)."""
+    import django
+    from django.apps import apps
+
+    if apps.ready:
+        return
+    web_app_dir = os.path.normpath(WEB_APP_DIR)
+    if web_app_dir not in sys.path:
+        sys.path.insert(0, web_app_dir)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EEGImage.settings')
+    django.setup()
+
+
+class SessionRecorder:
+    """Records a new Session without ever ending the EEG session.
+
+    Wraps generateImage.recording.BandPowerWriter. If the database cannot be
+    written (e.g. "python manage.py migrate" was not run after an update),
+    the error is printed once and the rest of the session is not recorded;
+    the prompt is still produced.
+    """
+
+    def __init__(self):
+        self.writer = None
+        try:
+            setup()
+            from generateImage import recording
+            self.writer = recording.start_session()
+        except Exception as e:
+            self._failed(e)
+
+    def _failed(self, error):
+        print('Session not recorded: ' + str(error))
+        self.writer = None
+
+    def _call(self, method, *args):
+        if self.writer is None:
+            return
+        try:
+            getattr(self.writer, method)(*args)
+        except Exception as e:
+            self._failed(e)
+
+    def add(self, tick, timestamp, delta, theta, alpha, beta, relax):
+        self._call('add', tick, timestamp, delta, theta, alpha, beta, relax)
+
+    def finish(self, prompt, category):
+        self._call('finish', prompt, category)
+
+    def close(self):
+        self._call('close')
+
+
+def start_session():
+    """New Session; returns its SessionRecorder."""
+    return SessionRecorder()
+
+
+def recent_categories(limit=200):
+    """Prompt categories of the latest sessions, newest first."""
+    setup()
+    from generateImage import recording
+    return recording.recent_categories(limit)
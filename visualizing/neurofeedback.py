@@ -17,7 +17,11 @@ import numpy as np  # Module that simplifies computations on matrices
 import matplotlib.pyplot as plt  # Module used for plotting
 from pylsl import StreamInlet, resolve_byprop  # Module to receive EEG data
 import utils  # Our own utility functions
-import random
+import acquisition  # Bounded-latency chunk pulling
+import aggregation  # Session summaries with artifact rejection
+import shared_ring  # Filtered EEG shared between processes
+import prompts  # Prompt vocabularies and categories
+import history  # Session records in the web app's database
 from datetime import datetime
 import os
 
@@ -47,51 +51,109 @@ OVERLAP_LENGTH = 0.8
 # Amount to 'shift' the start of each next consecutive epoch
 SHIFT_LENGTH = EPOCH_LENGTH - OVERLAP_LENGTH
 
+# Length of a recording session (in seconds)
+SESSION_LENGTH = 12
+
 # Index of the channel(s) (electrodes) to be used
 # 0 = left ear, 1 = left forehead, 2 = right forehead, 3 = right ear
 INDEX_CHANNEL = [0]
 
-if __name__ == "__main__":
+# Precision of the band power computation
+# np.float32 halves memory traffic on low-power kiosk machines
+DSP_DTYPE = np.float32
 
-    """ 1. CONNECT TO EEG STREAM """
+# Longest time (in seconds) a single pull from the inlet may block
+# Keeping this below SHIFT_LENGTH bounds the latency of each loop iteration
+PULL_TIMEOUT = 0.05
 
-    # Search for active LSL streams
-    print('Looking for an EEG stream...')
-    streams = resolve_byprop('type', 'EEG', timeout=2)
-    if len(streams) == 0:
-        raise RuntimeError('Can\'t find EEG stream.')
+# Longest run of dropped samples (in seconds) that is filled by interpolation
+MAX_GAP_LENGTH = 0.5
 
-    # Set active EEG stream to inlet and apply time correction
-    print("Start acquiring data")
-    inlet = StreamInlet(streams[0], max_chunklen=12)
-    eeg_time_correction = inlet.time_correction()
+# Artifact rejection for the session summary
+# Epochs whose raw peak-to-peak amplitude (uV) or variance (uV^2) exceed these
+# (blinks, jaw clenches, electrode pops) are left out, as are ticks with a
+# band more than ARTIFACT_Z_THRESHOLD robust standard deviations from the
+# session median
+ARTIFACT_MAX_PTP = 200
+ARTIFACT_MAX_VAR = 2500
+ARTIFACT_Z_THRESHOLD = 3.5
 
-    # Get the stream info and description
-    info = inlet.info()
-    description = info.desc()
+# Name of the shared-memory ring written by "python shared_ring.py produce"
+# When set, the already notch-filtered samples are read from it instead of
+# opening an LSL inlet, so other consumers can watch the same headset
+SHARED_RING = os.environ.get('EEG_SHARED_RING')
 
-    # Get the sampling frequency
-    # This is an important value that represents how many EEG data points are
-    # collected in a second. This influences our frequency band calculation.
-    # for the Muse 2016, this should always be 256
-    fs = int(info.nominal_srate())
+if __name__ == "__main__":
 
-    """ 2. INITIALIZE BUFFERS """
+    """ 1. CONNECT TO EEG STREAM """
+
+    if SHARED_RING:
+        # Another process owns the inlet and filters the data once for all
+        print('Reading EEG from shared memory ' + SHARED_RING)
+        ring = shared_ring.SharedRingBuffer.attach(SHARED_RING)
+        ring_reader = shared_ring.RingReader(ring)
+        fs = int(ring.fs)
+        reader = None
+    else:
+        ring = None
+
+        # Search for active LSL streams
+        print('Looking for an EEG stream...')
+        streams = resolve_byprop('type', 'EEG', timeout=2)
+        if len(streams) == 0:
+            raise RuntimeError('Can\'t find EEG stream.')
+
+        # Set active EEG stream to inlet and apply time correction
+        print("Start acquiring data")
+        inlet = StreamInlet(streams[0], max_chunklen=12)
+
+        # Get the stream info and description
+        info = inlet.info()
+        description = info.desc()
+
+        # Get the sampling frequency
+        # This is an important value that represents how many EEG data points are
+        # collected in a second. This influences our frequency band calculation.
+        # for the Muse 2016, this should always be 256
+        fs = int(info.nominal_srate())
+
+        # Pulls are bounded by PULL_TIMEOUT, stamped with the inlet's clock
+        # offset, and resampled so that dropped packets do not shift the FFT
+        reader = acquisition.ChunkReader(inlet, max_samples=int(SHIFT_LENGTH * fs),
+                                         timeout=PULL_TIMEOUT,
+                                         max_gap=MAX_GAP_LENGTH)
 
-    # Initialize raw EEG data buffer
-    eeg_buffer = np.zeros((int(fs * BUFFER_LENGTH), 1))
-    filter_state = None  # for use with the notch filter
+    """ 2. INITIALIZE BUFFERS """
 
     # Compute the number of epochs in "buffer_length"
     n_win_test = int(np.floor((BUFFER_LENGTH - EPOCH_LENGTH) /
                               SHIFT_LENGTH + 1))
 
-    # Initialize the band power buffer (for plotting)
-    # bands will be ordered: [delta, theta, alpha, beta]
-    band_buffer = np.zeros((n_win_test, 4))
+    # Raw EEG buffer, band power buffer (ordered [delta, theta, alpha, beta])
+    # and FFT workspace, all preallocated and written in place every tick
+    tick = utils.TickWorkspace(int(fs * BUFFER_LENGTH), EPOCH_LENGTH * fs,
+                               n_win_test, len(INDEX_CHANNEL), fs,
+                               dtype=DSP_DTYPE)
+
+    # Reused for the channels taken from the shared ring and for the
+    # features recorded each tick
+    channel_index = np.asarray(INDEX_CHANNEL)
+    ring_epoch_buffer = np.zeros((EPOCH_LENGTH * fs, len(INDEX_CHANNEL)),
+                                 dtype=np.float32)
+    tick_features = np.zeros(len(aggregation.FEATURES))
+
+    # Pulls return after at most PULL_TIMEOUT, usually with a single packet;
+    # band powers are only computed once per SHIFT_LENGTH of new samples, so
+    # the n_win_test epochs in tick.smooth still span BUFFER_LENGTH seconds
+    tick_counter = acquisition.TickCounter(SHIFT_LENGTH * fs)
 
     """ 3. GET DATA """
 
+    # Every tick is stored with the session; rows are buffered and written
+    # in batches so recording does not hold up the loop. A database error
+    # is reported but does not end the session
+    recorder = history.start_session()
+
     # The try/except structure allows to quit the while loop by aborting the
     # script with <Ctrl-C>
     print('Press Ctrl-C in the console to break the while loop.')
@@ -100,13 +162,13 @@ if __name__ == "__main__":
         now = datetime.now()
         start = now.strftime('%H:%M:%S')
         start_sec = int(start[0:2])*3600 + int(start[3:5])*60 + int(start[-2:])
-        end_sec = start_sec + 12
+        end_sec = start_sec + SESSION_LENGTH
 
-        alpha = []
-        beta = []
-        delta = []
-        theta = []
-        relax = []
+        # Per-tick [delta, theta, alpha, beta, relax], kept for the summary
+        session = aggregation.BandPowerSeries(
+            capacity=int(np.ceil(SESSION_LENGTH / SHIFT_LENGTH)) * 2,
+            max_ptp=ARTIFACT_MAX_PTP, max_var=ARTIFACT_MAX_VAR,
+            z_threshold=ARTIFACT_Z_THRESHOLD)
 
         # The following loop acquires data, computes band powers, and calculates neurofeedback metrics based on those band powers
         while True:
@@ -119,36 +181,48 @@ if __name__ == "__main__":
                 print(cur_sec)
 
             """ 3.1 ACQUIRE DATA """
-            # Obtain EEG data from the LSL stream
-            eeg_data, timestamp = inlet.pull_chunk(
-                timeout=1, max_samples=int(SHIFT_LENGTH * fs))
+            if ring is not None:
+                # The ring already holds the filtered, buffered samples:
+                # take the newest epoch straight from shared memory
+                if not ring_reader.wait(PULL_TIMEOUT):
+                    continue
+                seq = ring.seq
+                n_new = seq - ring_reader.next_seq
+                ring_reader.next_seq = seq
+                if not tick_counter.add(n_new) or seq < EPOCH_LENGTH * fs:
+                    continue
+                ring_epoch, _, _ = ring.latest(EPOCH_LENGTH * fs, seq=seq)
+                data_epoch = np.take(ring_epoch, channel_index, axis=1,
+                                     out=ring_epoch_buffer, mode='clip')
+                if not ring.is_intact(seq - EPOCH_LENGTH * fs):
+                    # The producer lapped us while copying: drop this tick
+                    continue
+            else:
+                # Obtain EEG data from the LSL stream
+                eeg_data, timestamp = reader.read()
+                if eeg_data.shape[0] == 0:
+                    # Nothing arrived within PULL_TIMEOUT; try again next tick
+                    continue
 
-            # Only keep the channel we're interested in
-            ch_data = np.array(eeg_data)[:, INDEX_CHANNEL]
+                # Only keep the channel we're interested in
+                ch_data = eeg_data[:, INDEX_CHANNEL]
 
-            # Update EEG buffer with the new data
-            eeg_buffer, filter_state = utils.update_buffer(
-                eeg_buffer, ch_data, notch=True,
-                filter_state=filter_state)
+                # Update EEG buffer with the new data
+                tick.add(ch_data)
+                if not tick_counter.add(ch_data.shape[0]):
+                    continue
 
-            """ 3.2 COMPUTE BAND POWERS """
-            # Get newest samples from the buffer
-            data_epoch = utils.get_last_data(eeg_buffer,
-                                             EPOCH_LENGTH * fs)
+                # Get newest samples from the buffer
+                data_epoch = tick.epoch()
 
+            """ 3.2 COMPUTE BAND POWERS """
             # Compute band powers
-            band_powers = utils.compute_band_powers(data_epoch, fs)
-            band_buffer, _ = utils.update_buffer(band_buffer,
-                                                 np.asarray([band_powers]))
-            # Compute the average band powers for all epochs in buffer
-            # This helps to smooth out noise
-            smooth_band_powers = np.mean(band_buffer, axis=0)
+            # tick.smooth holds the average band powers for all epochs in
+            # the buffer; this helps to smooth out noise
+            band_powers = tick.compute(data_epoch)
+            smooth_band_powers = tick.smooth
 
             print('Delta: ', band_powers[Band.Delta], ' Theta: ', band_powers[Band.Theta], ' Alpha: ', band_powers[Band.Alpha], ' Beta: ', band_powers[Band.Beta])
-            delta.append(band_powers[Band.Delta])
-            theta.append(band_powers[Band.Theta])
-            alpha.append(band_powers[Band.Alpha])
-            beta.append(band_powers[Band.Beta])
 
             """ 3.3 COMPUTE NEUROFEEDBACK METRICS """
             # These metrics could also be used to drive brain-computer interfaces
@@ -158,7 +232,11 @@ if __name__ == "__main__":
             alpha_metric = smooth_band_powers[Band.Alpha] / \
                 smooth_band_powers[Band.Delta]
             print('Alpha Relaxation: ', alpha_metric)
-            relax.append(alpha_metric)
+            tick_features[:4] = band_powers[Band.Delta:Band.Beta + 1]
+            tick_features[4] = alpha_metric
+            recorder.add(len(session), now.timestamp(), *tick_features.tolist())
+            session.append(tick_features, ptp=tick.workspace.ptp.max(),
+                           var=tick.workspace.var.max())
 
 
             # Beta Protocol:
@@ -175,126 +253,35 @@ if __name__ == "__main__":
             #     smooth_band_powers[Band.Alpha]
             # print('Theta Relaxation: ', theta_metric)
 
-        mean_alpha = sum(alpha)/len(alpha)
-        mean_beta = sum(beta)/len(beta)
-        mean_delta = sum(delta)/len(delta)
-        mean_theta = sum(theta)/len(theta)
-        mean_relax = sum(relax)/len(relax)
+        # Trimmed means of the ticks that survived artifact rejection
+        summary = session.summarize()
+        print('Ticks kept: ', summary['n_kept'], ' Ticks rejected: ', summary['n_rejected'])
+        features = summary['trimmed_mean']
+        if summary['n_kept'] == 0:
+            # Every tick looked like an artifact: fall back to raw medians
+            values = session.values
+            features = np.nanmedian(
+                np.where(np.isfinite(values), values, np.nan), axis=0)
+        mean_delta, mean_theta, mean_alpha, mean_beta, mean_relax = features
         print('A ', mean_alpha, 'B ', mean_beta, 'd ', mean_delta, 't ', mean_theta, 'r ', mean_relax)
+        if reader is not None:
+            print('Samples received: ', reader.n_received, ' Samples filled: ', reader.n_missing)
 
         path = '~/EEGImage/EEGImage/generateImage/static/prompt.txt'
         expanded = os.path.expanduser(path)
 
-        cozy_words = [
-            'warm blanket', 'soft pillow', 'fuzzy slippers', 'glowing fireplace', 'gentle rain', 
-            'candlelit dinner', 'fluffy cat', 'snug sweater', 'peaceful garden', 'quiet library',
-            'cozy cabin', 'soft music', 'velvet armchair', 'silk sheets', 'plush rug',
-            'sunny meadow', 'breezy porch', 'calm lake', 'starry night', 'autumn leaves',
-            'buttery popcorn', 'hot cocoa', 'freshly baked bread', 'lavender fields', 'sunset glow',
-            'morning dew', 'whispering pines', 'cherry blossoms', 'honeyed tea', 'gentle breeze',
-            'rustling leaves', 'soft clouds', 'mellow afternoon', 'tranquil stream', 'serene beach',
-            'quiet nook', 'dreamy hammock', 'velvet curtains', 'silken robe', 'peaceful retreat',
-            'sunlit room', 'cozy nook', 'warm bath', 'soft quilt', 'gentle waves',
-            'lush garden', 'quiet countryside', 'blooming flowers', 'golden sunrise', 'calm forest'
-        ]        
-
-        horror_scenes = [
-            'eerie shadow', 'haunted mansion', 'creepy doll', 'sinister whisper', 'ghostly apparition',
-            'dark forest', 'abandoned asylum', 'blood-curdling scream', 'chilling fog', 'ominous silence',
-            'macabre ritual', 'spooky graveyard', 'terrifying nightmare', 'ghastly figure', 'menacing laughter',
-            'cursed artifact', 'phantom presence', 'dreadful curse', 'nightmarish vision', 'frightening howl',
-            'horrific monster', 'sinister grin', 'gory scene', 'demonic possession', 'vampiric gaze',
-            'zombie apocalypse', 'witching hour', 'haunting melody', 'bone-chilling cold', 'spectral glow',
-            'murderous intent', 'evil spirit', 'forbidding castle', 'bloodthirsty creature', 'shadowy alley',
-            'terrifying legend', 'grisly discovery', 'unholy ground', 'malevolent force', 'creepy crypt',
-            'dark omen', 'sinister plot', 'haunted woods', 'eerie silence', 'ghostly wail',
-            'chilling presence', 'ominous storm', 'macabre dance', 'spine-tingling fear', 'dreadful secret'
-        ]
-
-        cute_adj = [
-            'adorable', 'charming', 'delightful', 'endearing', 'lovable', 
-            'sweet', 'precious', 'darling', 'cute', 'cuddly', 
-            'playful', 'cheerful', 'joyful', 'radiant', 'sparkling', 
-            'bubbly', 'vivacious', 'jolly', 'gleeful', 'merry', 
-            'sunny', 'blissful', 'graceful', 'elegant', 'fancy', 
-            'dapper', 'snazzy', 'spiffy', 'neat', 'tidy', 
-            'polished', 'refined', 'sophisticated', 'stylish', 'trendy', 
-            'fashionable', 'classy', 'posh', 'chic', 'snappy', 
-            'sprightly', 'zesty', 'peppy', 'lively', 'animated', 
-            'spirited', 'energetic', 'dynamic', 'vibrant', 'zippy'
-        ]
-
-        relax_adj = [
-            'calm', 'peaceful', 'serene', 'tranquil', 'soothing',
-            'quiet', 'restful', 'untroubled', 'composed', 'placid',
-            'gentle', 'mellow', 'mild', 'relaxed', 'easygoing',
-            'laid-back', 'unruffled', 'unperturbed', 'cool', 'collected',
-            'unflustered', 'unagitated', 'unworried', 'unconcerned', 'unfazed',
-            'unbothered', 'unmoved', 'unshaken', 'unexcited', 'unhassled',
-            'unpressured', 'unhurried', 'unrushed', 'unfrenzied', 'unfretful',
-            'unvexed', 'unperturbed', 'unruffled', 'untroubled', 'unflappable',
-            'unflustered', 'unagitated', 'unworried', 'unconcerned', 'unfazed',
-            'unbothered', 'unmoved', 'unshaken', 'unexcited', 'unhassled'
-        ]
-
-        stress_adj = [
-            'anxious', 'tense', 'nervous', 'worried', 'agitated',
-            'frantic', 'overwhelmed', 'frazzled', 'stressed', 'pressured',
-            'harried', 'strained', 'uptight', 'jittery', 'fretful',
-            'restless', 'uneasy', 'distressed', 'troubled', 'panicked',
-            'alarmed', 'fearful', 'apprehensive', 'distraught', 'perturbed',
-            'disconcerted', 'discomposed', 'flustered', 'rattled', 'shaken',
-            'unnerved', 'disquieted', 'disturbed', 'unsettled', 'jumpy',
-            'edgy', 'twitchy', 'hyper', 'keyed-up', 'wired',
-            'stiff', 'taut', 'rigid', 'inflexible', 'inhibited',
-            'constrained', 'confined', 'restricted', 'compressed', 'compressed'
-        ]
-
-        stressful_noun = [
-            'deadline', 'traffic jam', 'earthquake', 'tornado', 'hurricane',
-            'flood', 'blizzard', 'heatwave', 'drought', 'wildfire',
-            'avalanche', 'tsunami', 'volcano', 'storm', 'hailstorm',
-            'cyclone', 'landslide', 'thunderstorm', 'lightning', 'fog',
-            'smog', 'pollution', 'noise', 'crowd', 'chaos',
-            'conflict', 'argument', 'debate', 'crisis', 'emergency',
-            'accident', 'injury', 'illness', 'disease', 'infection',
-            'contagion', 'epidemic', 'pandemic', 'quarantine', 'lockdown',
-            'evacuation', 'fire', 'explosion', 'collapse', 'blackout',
-            'shortage', 'scarcity', 'famine', 'poverty', 'homelessness'
-        ]
-
-        cute_noun = [
-            'kitten', 'puppy', 'bunny', 'teddy bear', 'duckling',
-            'chick', 'fawn', 'cub', 'joey', 'calf',
-            'lamb', 'foal', 'piglet', 'hedgehog', 'koala',
-            'panda', 'penguin', 'owl', 'parrot', 'goldfish',
-            'hamster', 'gerbil', 'guinea pig', 'chinchilla', 'ferret',
-            'onesie', 'mittens', 'booties', 'beanie', 'scarf',
-            'smile', 'giggle', 'wink', 'blush', 'dimples',
-            'heart', 'star', 'rainbow', 'butterfly', 'ladybug',
-            'flower', 'cupcake', 'cookie', 'marshmallow', 'lollipop',
-            'balloon', 'ribbon', 'bow', 'button', 'pebble'
-        ]
-
+        category = prompts.prompt_category(mean_delta, mean_theta, mean_alpha,
+                                           mean_beta, mean_relax)
+        prompt = prompts.compose_prompt(category)
         with open(expanded, 'w') as f:
-            if mean_relax >= 0.45:
-                f.write(random.choice(cozy_words))
-            else:
-                f.write(random.choice(horror_scenes))
-
-            if mean_theta + mean_alpha >= 1.1:
-                f.write(random.choice(cute_adj))
-                f.write(random.choice(relax_adj))
-            else:
-                f.write(random.choice(stress_adj))
-                f.write(random.choice(stressful_noun))
+            f.write(prompt)
 
-            if mean_beta + mean_delta >= 1.1:
-                f.write(random.choice(stress_adj))
-                f.write(random.choice(stressful_noun))
-            else:
-                f.write(random.choice(cozy_words))
-                f.write(random.choice(cute_noun))
+        # draw.py serves a pre-generated image of the same category if the
+        # warm-up scheduler has one; past categories tell it which to prepare
+        with open(os.path.join(os.path.dirname(expanded), prompts.CATEGORY_FILE), 'w') as f:
+            f.write(category)
+        recorder.finish(prompt, category)
 
     except KeyboardInterrupt:
+        recorder.close()
         print('Closing!')
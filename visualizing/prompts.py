@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Prompts from Band Powers
+
+The mean band powers of a session select one of a few prompt categories, and
+the prompt is composed of random words from that category's vocabularies.
+Because the vocabularies are small and fixed, images can be generated ahead
+of time for a category (see warmup.py) and served to any session that lands
+in it.
+
+"""
+
+import random
+
+
+# Written next to prompt.txt by neurofeedback.py, read by draw.py
+CATEGORY_FILE = 'prompt_category.txt'
+
+# Session thresholds, one per part of the prompt
+RELAX_THRESHOLD = 0.45  # relax metric (alpha / delta)
+CALM_THRESHOLD = 1.1  # theta + alpha
+ACTIVE_THRESHOLD = 1.1  # beta + delta
+
+COZY_WORDS = [
+    'warm blanket', 'soft pillow', 'fuzzy slippers', 'glowing fireplace', 'gentle rain',
+    'candlelit dinner', 'fluffy cat', 'snug sweater', 'peaceful garden', 'quiet library',
+    'cozy cabin', 'soft music', 'velvet armchair', 'silk sheets', 'plush rug',
+    'sunny meadow', 'breezy porch', 'calm lake', 'starry night', 'autumn leaves',
+    'buttery popcorn', 'hot cocoa', 'freshly baked bread', 'lavender fields', 'sunset glow',
+    'morning dew', 'whispering pines', 'cherry blossoms', 'honeyed tea', 'gentle breeze',
+    'rustling leaves', 'soft clouds', 'mellow afternoon', 'tranquil stream', 'serene beach',
+    'quiet nook', 'dreamy hammock', 'velvet curtains', 'silken robe', 'peaceful retreat',
+    'sunlit room', 'cozy nook', 'warm bath', 'soft quilt', 'gentle waves',
+    'lush garden', 'quiet countryside', 'blooming flowers', 'golden sunrise', 'calm forest'
+]
+
+HORROR_SCENES = [
+    'eerie shadow', 'haunted mansion', 'creepy doll', 'sinister whisper', 'ghostly apparition',
+    'dark forest', 'abandoned asylum', 'blood-curdling scream', 'chilling fog', 'ominous silence',
+    'macabre ritual', 'spooky graveyard', 'terrifying nightmare', 'ghastly figure', 'menacing laughter',
+    'cursed artifact', 'phantom presence', 'dreadful curse', 'nightmarish vision', 'frightening howl',
+    'horrific monster', 'sinister grin', 'gory scene', 'demonic possession', 'vampiric gaze',
+    'zombie apocalypse', 'witching hour', 'haunting melody', 'bone-chilling cold', 'spectral glow',
+    'murderous intent', 'evil spirit', 'forbidding castle', 'bloodthirsty creature', 'shadowy alley',
+    'terrifying legend', 'grisly discovery', 'unholy ground', 'malevolent force', 'creepy crypt',
+    'dark omen', 'sinister plot', 'haunted woods', 'eerie silence', 'ghostly wail',
+    'chilling presence', 'ominous storm', 'macabre dance', 'spine-tingling fear', 'dreadful secret'
+]
+
+CUTE_ADJ = [
+    'adorable', 'charming', 'delightful', 'endearing', 'lovable',
+    'sweet', 'precious', 'darling', 'cute', 'cuddly',
+    'playful', 'cheerful', 'joyful', 'radiant', 'sparkling',
+    'bubbly', 'vivacious', 'jolly', 'gleeful', 'merry',
+    'sunny', 'blissful', 'graceful', 'elegant', 'fancy',
+    'dapper', 'snazzy', 'spiffy', 'neat', 'tidy',
+    'polished', 'refined', 'sophisticated', 'stylish', 'trendy',
+    'fashionable', 'classy', 'posh', 'chic', 'snappy',
+    'sprightly', 'zesty', 'peppy', 'lively', 'animated',
+    'spirited', 'energetic', 'dynamic', 'vibrant', 'zippy'
+]
+
+RELAX_ADJ = [
+    'calm', 'peaceful', 'serene', 'tranquil', 'soothing',
+    'quiet', 'restful', 'untroubled', 'composed', 'placid',
+    'gentle', 'mellow', 'mild', 'relaxed', 'easygoing',
+    'laid-back', 'unruffled', 'unperturbed', 'cool', 'collected',
+    'unflustered', 'unagitated', 'unworried', 'unconcerned', 'unfazed',
+    'unbothered', 'unmoved', 'unshaken', 'unexcited', 'unhassled',
+    'unpressured', 'unhurried', 'unrushed', 'unfrenzied', 'unfretful',
+    'unvexed', 'unperturbed', 'unruffled', 'untroubled', 'unflappable',
+    'unflustered', 'unagitated', 'unworried', 'unconcerned', 'unfazed',
+    'unbothered', 'unmoved', 'unshaken', 'unexcited', 'unhassled'
+]
+
+STRESS_ADJ = [
+    'anxious', 'tense', 'nervous', 'worried', 'agitated',
+    'frantic', 'overwhelmed', 'frazzled', 'stressed', 'pressured',
+    'harried', 'strained', 'uptight', 'jittery', 'fretful',
+    'restless', 'uneasy', 'distressed', 'troubled', 'panicked',
+    'alarmed', 'fearful', 'apprehensive', 'distraught', 'perturbed',
+    'disconcerted', 'discomposed', 'flustered', 'rattled', 'shaken',
+    'unnerved', 'disquieted', 'disturbed', 'unsettled', 'jumpy',
+    'edgy', 'twitchy', 'hyper', 'keyed-up', 'wired',
+    'stiff', 'taut', 'rigid', 'inflexible', 'inhibited',
+    'constrained', 'confined', 'restricted', 'compressed', 'compressed'
+]
+
+STRESSFUL_NOUN = [
+    'deadline', 'traffic jam', 'earthquake', 'tornado', 'hurricane',
+    'flood', 'blizzard', 'heatwave', 'drought', 'wildfire',
+    'avalanche', 'tsunami', 'volcano', 'storm', 'hailstorm',
+    'cyclone', 'landslide', 'thunderstorm', 'lightning', 'fog',
+    'smog', 'pollution', 'noise', 'crowd', 'chaos',
+    'conflict', 'argument', 'debate', 'crisis', 'emergency',
+    'accident', 'injury', 'illness', 'disease', 'infection',
+    'contagion', 'epidemic', 'pandemic', 'quarantine', 'lockdown',
+    'evacuation', 'fire', 'explosion', 'collapse', 'blackout',
+    'shortage', 'scarcity', 'famine', 'poverty', 'homelessness'
+]
+
+CUTE_NOUN = [
+    'kitten', 'puppy', 'bunny', 'teddy bear', 'duckling',
+    'chick', 'fawn', 'cub', 'joey', 'calf',
+    'lamb', 'foal', 'piglet', 'hedgehog', 'koala',
+    'panda', 'penguin', 'owl', 'parrot', 'goldfish',
+    'hamster', 'gerbil', 'guinea pig', 'chinchilla', 'ferret',
+    'onesie', 'mittens', 'booties', 'beanie', 'scarf',
+    'smile', 'giggle', 'wink', 'blush', 'dimples',
+    'heart', 'star', 'rainbow', 'butterfly', 'ladybug',
+    'flower', 'cupcake', 'cookie', 'marshmallow', 'lollipop',
+    'balloon', 'ribbon', 'bow', 'button', 'pebble'
+]
+
+
+# A category is one character per threshold, '1' if the session reached it
+# e.g. '100': relaxed, not calm, not active
+CATEGORIES = ['%d%d%d' % (relaxed, calm, active)
+              for relaxed in (1, 0) for calm in (1, 0) for active in (1, 0)]
+
+
+def prompt_category(delta, theta, alpha, beta, relax):
+    """Category of a session from its mean band powers and relax metric."""
+    relaxed = relax >= RELAX_THRESHOLD
+    calm = theta + alpha >= CALM_THRESHOLD
+    active = beta + delta >= ACTIVE_THRESHOLD
+    return '%d%d%d' % (relaxed, calm, active)
+
+
+def compose_prompt(category, rng=random):
+    """Draw a prompt for a category.
+
+    Args:
+        category (str): one of CATEGORIES
+        rng (random.Random): source of the word choices
+
+    Returns:
+        (str): the prompt
+    """
+    relaxed, calm, active = (flag == '1' for flag in category)
+    words = []
+
+    if relaxed:
+        words.append(rng.choice(COZY_WORDS))
+    else:
+        words.append(rng.choice(HORROR_SCENES))
+
+    if calm:
+        words.append(rng.choice(CUTE_ADJ))
+        words.append(rng.choice(RELAX_ADJ))
+    else:
+        words.append(rng.choice(STRESS_ADJ))
+        words.append(rng.choice(STRESSFUL_NOUN))
+
+    if active:
+        words.append(rng.choice(STRESS_ADJ))
+        words.append(rng.choice(STRESSFUL_NOUN))
+    else:
+        words.append(rng.choice(COZY_WORDS))
+        words.append(rng.choice(CUTE_NOUN))
+
+    return ''.join(words)
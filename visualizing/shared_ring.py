@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Shared-Memory Fan-Out of Live EEG
+
+One producer process owns the LSL inlet, notch-filters the samples once and
+writes them into a ring buffer in shared memory. Any number of consumers
+(neurofeedback metrics, a recorder, a live plot) attach to it by name and
+read the latest samples as numpy views, without copying and without opening
+their own inlet.
+
+    python shared_ring.py produce               # owns the headset
+    EEG_SHARED_RING=muse python neurofeedback.py
+    python shared_ring.py record session.npz
+    python shared_ring.py plot
+
+The ring is mirrored: every sample is stored twice, "capacity" slots apart,
+so that any window of up to "capacity" samples is one contiguous slice.
+A sequence counter (the total number of samples written) is published after
+the samples themselves; readers use it to find new data and to check that a
+view was not overwritten while they used it.
+
+"""
+
+import argparse
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from scipy.signal import lfilter, lfilter_zi
+
+import acquisition
+import utils
+
+
+DEFAULT_NAME = 'muse'
+
+# Header: sequence counter, capacity, channel count, layout version, then the
+# sampling frequency as a float64
+_HEADER_SLOTS = 8
+_SEQ, _CAPACITY, _CHANNELS, _VERSION, _FS = range(5)
+_LAYOUT_VERSION = 1
+
+
+def _sizes(capacity, n_channels):
+    header = _HEADER_SLOTS * 8
+    data = 2 * capacity * n_channels * 4
+    data += -data % 8  # keep the timestamps 8-byte aligned
+    timestamps = 2 * capacity * 8
+    return header, data, timestamps
+
+
+class SharedRingBuffer:
+    """Mirrored ring of float32 samples and float64 timestamps in shared
+    memory. Use create() in the producer and attach() in consumers.
+    """
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.name = shm.name
+        self.owner = owner
+        buf = shm.buf
+
+        self._header = np.ndarray((_HEADER_SLOTS,), dtype=np.int64, buffer=buf)
+        if self._header[_VERSION] != _LAYOUT_VERSION:
+            raise RuntimeError('Shared memory %r is not an EEG ring buffer'
+                               % shm.name)
+        self.capacity = int(self._header[_CAPACITY])
+        self.n_channels = int(self._header[_CHANNELS])
+        self.fs = float(self._header[_FS:_FS + 1].view(np.float64)[0])
+
+        header, data, _ = _sizes(self.capacity, self.n_channels)
+        self._data = np.ndarray((2 * self.capacity, self.n_channels),
+                                dtype=np.float32, buffer=buf, offset=header)
+        self._timestamps = np.ndarray((2 * self.capacity,), dtype=np.float64,
+                                      buffer=buf, offset=header + data)
+
+    @classmethod
+    def create(cls, name, capacity, n_channels, fs):
+        """Allocate a new ring (producer side)."""
+        size = sum(_sizes(capacity, n_channels))
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((_HEADER_SLOTS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_CAPACITY] = capacity
+        header[_CHANNELS] = n_channels
+        header[_FS:_FS + 1].view(np.float64)[0] = fs
+        header[_VERSION] = _LAYOUT_VERSION
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Open an existing ring (consumer side)."""
+        # Every process that opens a segment registers it with its resource
+        # tracker, which removes it at exit; only the producer should. 3.13
+        # added track=False to skip that, older versions need unregister()
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    def close(self):
+        # Views into the buffer must go before the mapping can be closed
+        self._header = self._data = self._timestamps = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def seq(self):
+        """(int): total number of samples written so far"""
+        return int(self._header[_SEQ])
+
+    def write(self, samples, timestamps):
+        """Append samples [n, n_channels] and their timestamps [n]."""
+        n = samples.shape[0]
+        if n == 0:
+            return
+        if n > self.capacity:
+            samples, timestamps = samples[-self.capacity:], timestamps[-self.capacity:]
+            skipped, n = n - self.capacity, self.capacity
+        else:
+            skipped = 0
+
+        seq = self.seq + skipped
+        start = seq % self.capacity
+        utils.write_mirrored(self._data, start, samples)
+        utils.write_mirrored(self._timestamps, start, timestamps)
+
+        # Publish only once the samples are in place
+        self._header[_SEQ] = seq + n
+
+    def latest(self, n_samples, seq=None):
+        """Views of the newest samples, without copying.
+
+        Args:
+            n_samples (int): window length, at most "capacity"
+            seq (int): end of the window; defaults to the current sequence
+
+        Returns:
+            (numpy.ndarray): samples [n_samples, n_channels] (read-only view)
+            (numpy.ndarray): timestamps [n_samples] (read-only view)
+            (int): sequence number just after the last sample of the window
+        """
+        if n_samples > self.capacity:
+            raise ValueError('window longer than the ring capacity')
+        if seq is None:
+            seq = self.seq
+        n_samples = min(n_samples, seq)
+        end = seq % self.capacity + self.capacity
+        data = self._data[end - n_samples:end]
+        timestamps = self._timestamps[end - n_samples:end]
+        data.flags.writeable = False
+        timestamps.flags.writeable = False
+        return data, timestamps, seq
+
+    def is_intact(self, first_seq):
+        """Check that samples from "first_seq" on have not been overwritten.
+
+        Call after using a view returned by latest(): if this is False, the
+        writer lapped the reader and the view may hold newer samples.
+        """
+        return self.seq - first_seq <= self.capacity
+
+
+class RingReader:
+    """Consumer of a SharedRingBuffer with the interface of an LSL inlet.
+
+    pull_chunk() returns the samples written since the previous call, so the
+    ring can be plugged into code written for pylsl.StreamInlet (e.g.
+    acquisition.ChunkReader). Samples that were overwritten before being read
+    are counted in "n_lost".
+
+    Args:
+        ring (SharedRingBuffer): ring to read
+        from_start (bool): start with the oldest samples still in the ring
+            instead of only new ones
+    """
+
+    def __init__(self, ring, from_start=False):
+        self.ring = ring
+        seq = ring.seq
+        self.next_seq = max(seq - ring.capacity, 0) if from_start else seq
+        self.n_lost = 0
+
+    def info(self, timeout=None):
+        return acquisition.LocalStreamInfo(self.ring.fs, self.ring.n_channels,
+                                           name='SharedRing',
+                                           source_id=self.ring.name)
+
+    def time_correction(self, timeout=None):
+        # The producer already converted the timestamps to the local clock
+        return 0.0
+
+    def wait(self, timeout):
+        """Wait up to "timeout" seconds for unread samples; True if any."""
+        deadline = time.perf_counter() + timeout
+        while self.ring.seq <= self.next_seq:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            time.sleep(min(remaining, 1 / self.ring.fs))
+        return True
+
+    def read(self, max_samples):
+        """Views of the samples written since the previous call, without
+        copying.
+
+        Returns:
+            (numpy.ndarray): samples [n, n_channels] (read-only view)
+            (numpy.ndarray): timestamps [n] (read-only view)
+            (int): sequence number of the first sample; pass it to
+                ring.is_intact() once done with the views
+        """
+        seq = self.ring.seq
+        if seq - self.next_seq > self.ring.capacity:
+            lost = seq - self.ring.capacity - self.next_seq
+            self.n_lost += lost
+            self.next_seq += lost
+        first_seq = self.next_seq
+        n = min(seq - first_seq, max_samples)
+        data, timestamps, _ = self.ring.latest(n, seq=first_seq + n)
+        self.next_seq += n
+        return data, timestamps, first_seq
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024, dest_obj=None):
+        if timeout:
+            self.wait(timeout)
+        data, timestamps, _ = self.read(max_samples)
+        n = timestamps.shape[0]
+
+        timestamps = timestamps.tolist()
+        if dest_obj is not None:
+            dest_obj[:n] = data
+            return None, timestamps
+        return data.tolist(), timestamps
+
+
+def produce(inlet, ring, stop=None, pull_timeout=0.05, max_gap=0.5):
+    """Pump samples from an inlet into the ring, notch-filtered once.
+
+    Args:
+        inlet (pylsl.StreamInlet): source of the samples
+        ring (SharedRingBuffer): destination
+        stop (callable): returns True to end the loop; runs until
+            interrupted if None
+    """
+    fs = ring.fs
+    reader = acquisition.ChunkReader(inlet, max_samples=int(fs),
+                                     timeout=pull_timeout, max_gap=max_gap)
+    filter_state = np.tile(lfilter_zi(utils.NOTCH_B, utils.NOTCH_A),
+                           (ring.n_channels, 1)).T
+    while stop is None or not stop():
+        data, timestamps = reader.read()
+        if data.shape[0] == 0:
+            continue
+        data, filter_state = lfilter(utils.NOTCH_B, utils.NOTCH_A, data,
+                                     axis=0, zi=filter_state)
+        ring.write(data, timestamps)
+
+
+def run_producer(args):
+    from pylsl import StreamInlet, resolve_byprop
+
+    print('Looking for an EEG stream...')
+    streams = resolve_byprop('type', 'EEG', timeout=2)
+    if len(streams) == 0:
+        raise RuntimeError('Can\'t find EEG stream.')
+    inlet = StreamInlet(streams[0], max_chunklen=12)
+    info = inlet.info()
+
+    fs = info.nominal_srate()
+    with SharedRingBuffer.create(args.name, int(args.seconds * fs),
+                                 info.channel_count(), fs) as ring:
+        print('Sharing %d channels as %r, press Ctrl-C to stop.'
+              % (ring.n_channels, args.name))
+        try:
+            produce(inlet, ring)
+        except KeyboardInterrupt:
+            print('Closing!')
+
+
+def run_recorder(args):
+    ring = SharedRingBuffer.attach(args.name)
+    reader = RingReader(ring)
+    chunks, stamps = [], []
+    print('Recording, press Ctrl-C to stop.')
+    try:
+        while True:
+            if not reader.wait(0.5):
+                continue
+            data, timestamps, first_seq = reader.read(ring.capacity)
+            # One copy, straight out of shared memory
+            data, timestamps = data.copy(), timestamps.copy()
+            if ring.is_intact(first_seq):
+                chunks.append(data)
+                stamps.append(timestamps)
+            else:
+                # Overwritten while being copied
+                reader.n_lost += timestamps.shape[0]
+    except KeyboardInterrupt:
+        pass
+    if chunks:
+        np.savez(args.output, eeg=np.concatenate(chunks),
+                 timestamps=np.concatenate(stamps), fs=ring.fs)
+    print('Saved %d samples to %s (%d lost)'
+          % (sum(len(s) for s in stamps), args.output, reader.n_lost))
+    ring.close()
+
+
+def run_plot(args):
+    import matplotlib.pyplot as plt
+
+    ring = SharedRingBuffer.attach(args.name)
+    n = min(int(args.seconds * ring.fs), ring.capacity)
+    fig, ax = plt.subplots()
+    lines = ax.plot(np.zeros((n, ring.n_channels)))
+    ax.set_ylim(-args.scale, args.scale * (2 * ring.n_channels - 1))
+    plt.ion()
+    plt.show()
+    try:
+        while plt.fignum_exists(fig.number):
+            data, _, _ = ring.latest(n)
+            for ch, line in enumerate(lines):
+                line.set_data(np.arange(data.shape[0]),
+                              data[:, ch] + 2 * args.scale * ch)
+            plt.pause(0.05)
+    except KeyboardInterrupt:
+        pass
+    ring.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--name', default=DEFAULT_NAME,
+                        help='name of the shared memory segment')
+    commands = parser.add_subparsers(dest='command', required=True)
+    producer = commands.add_parser('produce', help='own the LSL inlet')
+    producer.add_argument('--seconds', type=float, default=30,
+                          help='length of the ring')
+    recorder = commands.add_parser('record', help='save samples to .npz')
+    recorder.add_argument('output')
+    plot = commands.add_parser('plot', help='live plot of all channels')
+    plot.add_argument('--seconds', type=float, default=5)
+    plot.add_argument('--scale', type=float, default=100)
+    args = parser.parse_args()
+
+    {'produce': run_producer, 'record': run_recorder,
+     'plot': run_plot}[args.command](args)
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic EEG Source
+
+A deterministic stand-in for a Muse headset, for CI and load testing on
+machines without Bluetooth or hardware. The signal is a sum of band-specific
+oscillations, 1/f (pink) background noise and mains hum, with blinks and jaw
+clenches injected at random times.
+
+It can be used in two ways:
+
+    - in process, through FakeInlet, which has the pull_chunk / info /
+      time_correction interface of pylsl.StreamInlet
+    - as a real LSL stream, so that neurofeedback.py runs unchanged:
+
+        python synthetic.py outlet
+
+Many virtual headsets can be run through the acquisition and DSP path of
+neurofeedback.py at once with:
+
+    python synthetic.py bench --headsets 64
+
+"""
+
+import argparse
+import time
+
+import numpy as np
+from scipy.signal import lfilter
+
+import acquisition
+import utils
+
+
+MUSE_CHANNELS = ['TP9', 'AF7', 'AF8', 'TP10', 'Right AUX']
+
+# Frequency (Hz) and amplitude (uV) of the oscillation placed in each band
+DEFAULT_BANDS = {
+    'delta': (2.0, 12.0),
+    'theta': (6.0, 8.0),
+    'alpha': (10.0, 15.0),
+    'beta': (20.0, 4.0),
+}
+
+# Filter turning white noise into pink (1/f) noise (Paul Kellet's
+# approximation, accurate to within 0.05 dB above fs / 1000)
+PINK_B = np.array([0.049922035, -0.095993537, 0.050612699, -0.004408786])
+PINK_A = np.array([1, -2.494956002, 2.017265875, -0.522189400])
+
+# Muse headsets send samples over Bluetooth in packets of 12
+PACKET_SIZE = 12
+
+
+class SyntheticEEG:
+    """Endless, deterministic multichannel EEG signal.
+
+    The output only depends on the seed and on the total number of samples
+    generated, not on how generate() calls are chunked.
+
+    Args:
+        fs (float): sampling frequency
+        n_channels (int): number of channels
+        bands (dict): band name -> (frequency in Hz, amplitude in uV)
+        pink_amplitude (float): standard deviation of the 1/f noise (uV)
+        mains_frequency (float): mains hum frequency (Hz), 50 or 60
+        mains_amplitude (float): mains hum amplitude (uV)
+        blink_rate (float): blinks per second on the frontal channels
+        clench_rate (float): jaw clenches per second on the temporal channels
+        seed (int): random seed
+    """
+
+    def __init__(self, fs=256, n_channels=len(MUSE_CHANNELS), bands=None,
+                 pink_amplitude=10.0, mains_frequency=60.0,
+                 mains_amplitude=5.0, blink_rate=0.1, clench_rate=0.05,
+                 seed=0):
+        self.fs = fs
+        self.n_channels = n_channels
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+
+        bands = DEFAULT_BANDS if bands is None else bands
+        freqs = np.array([f for f, _ in bands.values()])
+        amps = np.array([a for _, a in bands.values()])
+        # Each channel gets its own phase and a slightly detuned frequency
+        self._freqs = freqs[:, np.newaxis] * rng.uniform(0.97, 1.03,
+                                                         (len(freqs), n_channels))
+        self._amps = amps[:, np.newaxis] * np.ones((1, n_channels))
+        self._phases = rng.uniform(0, 2 * np.pi, (len(freqs), n_channels))
+
+        self.pink_amplitude = pink_amplitude
+        self.mains_frequency = mains_frequency
+        self.mains_amplitude = mains_amplitude
+        self._mains_phase = rng.uniform(0, 2 * np.pi)
+
+        # Pink noise is filtered white noise; the filter state carries over
+        # between calls so chunking does not matter
+        self._noise_rng = np.random.default_rng([seed, 1])
+        self._pink_zi = np.zeros((len(PINK_A) - 1, n_channels))
+        # Normalize the filter output to unit standard deviation
+        self._pink_gain = 1 / np.sqrt(np.sum(
+            _impulse_response(PINK_B, PINK_A, 4096) ** 2))
+
+        # One generator per artifact type, so their draws never interleave
+        self._blink_rng = np.random.default_rng([seed, 2])
+        self._clench_rng = np.random.default_rng([seed, 4])
+        self.blink_rate = blink_rate
+        self.clench_rate = clench_rate
+        self._next_blink = self._next_onset(self._blink_rng, blink_rate, 0)
+        self._next_clench = self._next_onset(self._clench_rng, clench_rate, 0)
+        self._artifacts = []  # (start sample, waveform [n, n_channels])
+
+        self.n_generated = 0
+
+    def _next_onset(self, rng, rate, after):
+        if rate <= 0:
+            return None
+        return after + int(rng.exponential(self.fs / rate))
+
+    def _blink(self):
+        # Slow positive deflection on the frontal electrodes
+        n = int(0.4 * self.fs)
+        shape = np.hanning(n) * self._blink_rng.uniform(100, 250)
+        waveform = np.zeros((n, self.n_channels))
+        for ch in (1, 2):
+            if ch < self.n_channels:
+                waveform[:, ch] = shape
+        return waveform
+
+    def _clench(self):
+        # Broadband muscle activity on the temporal electrodes
+        n = int(self._clench_rng.uniform(0.3, 1.0) * self.fs)
+        burst = self._clench_rng.normal(
+            0, self._clench_rng.uniform(30, 80), (n, self.n_channels))
+        waveform = np.zeros((n, self.n_channels))
+        for ch in (0, 3):
+            if ch < self.n_channels:
+                waveform[:, ch] = burst[:, ch] * np.hanning(n)
+        return waveform
+
+    def _schedule_artifacts(self, end):
+        while self._next_blink is not None and self._next_blink < end:
+            self._artifacts.append((self._next_blink, self._blink()))
+            self._next_blink = self._next_onset(
+                self._blink_rng, self.blink_rate, self._next_blink)
+        while self._next_clench is not None and self._next_clench < end:
+            self._artifacts.append((self._next_clench, self._clench()))
+            self._next_clench = self._next_onset(
+                self._clench_rng, self.clench_rate, self._next_clench)
+
+    def generate(self, n_samples):
+        """Produce the next "n_samples" samples.
+
+        Returns:
+            (numpy.ndarray): float32 array of shape [n_samples, n_channels]
+        """
+        start = self.n_generated
+        end = start + n_samples
+        t = np.arange(start, end) / self.fs
+
+        # Band oscillations: [n_samples, n_bands, n_channels] summed over bands
+        angles = (2 * np.pi * t[:, np.newaxis, np.newaxis] *
+                  self._freqs[np.newaxis] + self._phases[np.newaxis])
+        data = np.einsum('tbc,bc->tc', np.sin(angles), self._amps)
+
+        white = self._noise_rng.standard_normal((n_samples, self.n_channels))
+        pink, self._pink_zi = lfilter(PINK_B, PINK_A, white, axis=0,
+                                      zi=self._pink_zi)
+        data += self.pink_amplitude * self._pink_gain * pink
+
+        data += (self.mains_amplitude *
+                 np.sin(2 * np.pi * self.mains_frequency * t +
+                        self._mains_phase))[:, np.newaxis]
+
+        self._schedule_artifacts(end)
+        remaining = []
+        for onset, waveform in self._artifacts:
+            lo, hi = max(onset, start), min(onset + waveform.shape[0], end)
+            if lo < hi:
+                data[lo - start:hi - start] += waveform[lo - onset:hi - onset]
+            if onset + waveform.shape[0] > end:
+                remaining.append((onset, waveform))
+        self._artifacts = remaining
+
+        self.n_generated = end
+        return data.astype(np.float32)
+
+
+def _impulse_response(b, a, n):
+    impulse = np.zeros(n)
+    impulse[0] = 1
+    return lfilter(b, a, impulse)
+
+
+class FakeInlet:
+    """In-process replacement for pylsl.StreamInlet.
+
+    In real time mode samples become available in 12-sample packets as the
+    wall clock advances, and pull_chunk waits like the real inlet does: until
+    "max_samples" samples are in or the timeout expires. With
+    realtime=False every pull returns "max_samples" immediately, which makes
+    tests fast and fully deterministic.
+
+    Packet loss and clock jitter can be simulated to exercise the gap
+    handling in acquisition.py.
+
+    Args:
+        source (SyntheticEEG): signal to stream
+        realtime (bool): pace samples with the wall clock
+        drop_rate (float): fraction of 12-sample packets lost
+        jitter (float): standard deviation of the timestamp noise (seconds)
+        time_offset (float): offset between the headset clock and the local
+            clock, returned by time_correction()
+        seed (int): random seed for packet loss and jitter
+    """
+
+    def __init__(self, source, realtime=True, drop_rate=0.0, jitter=0.0,
+                 time_offset=0.0, seed=0):
+        self.source = source
+        self.realtime = realtime
+        self.drop_rate = drop_rate
+        self.jitter = jitter
+        self.time_offset = time_offset
+        self._rng = np.random.default_rng([seed, 3])
+        self._info = acquisition.LocalStreamInfo(
+            source.fs, source.n_channels, name='SyntheticMuse',
+            source_id='synthetic%d' % source.seed)
+        self._t0 = time.perf_counter()
+        self.n_dropped = 0
+
+    def info(self, timeout=None):
+        return self._info
+
+    def time_correction(self, timeout=None):
+        return self.time_offset
+
+    def _available(self):
+        if not self.realtime:
+            return None
+        due = int((time.perf_counter() - self._t0) * self.source.fs)
+        due -= due % PACKET_SIZE
+        return max(due - self.source.n_generated, 0)
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024, dest_obj=None):
+        """Return (samples, timestamps) like pylsl.StreamInlet.pull_chunk.
+
+        When "dest_obj" is given, samples are written into it and None is
+        returned in their place.
+        """
+        available = self._available()
+        if available is not None and available < max_samples and timeout:
+            # Wait for the packet completing "max_samples", but no longer
+            # than the timeout
+            ready = self.source.n_generated + max_samples
+            ready += -ready % PACKET_SIZE
+            delay = self._t0 + ready / self.source.fs - time.perf_counter()
+            time.sleep(max(min(delay, timeout), 0))
+            available = self._available()
+
+        n = max_samples if available is None else min(available, max_samples)
+        start = self.source.n_generated
+        data = self.source.generate(n)
+
+        index = np.arange(start, start + n)
+        timestamps = index / self.source.fs - self.time_offset
+        if self.realtime:
+            timestamps = timestamps + self._t0
+        if self.jitter:
+            timestamps = timestamps + self._rng.normal(0, self.jitter, n)
+
+        if self.drop_rate:
+            packets = index // PACKET_SIZE
+            first = packets[0] if n else 0
+            lost = self._rng.random(packets[-1] - first + 1 if n else 0)
+            keep = lost[packets - first] >= self.drop_rate
+            self.n_dropped += int(n - keep.sum())
+            data, timestamps = data[keep], timestamps[keep]
+
+        if dest_obj is not None:
+            dest_obj[:data.shape[0]] = data
+            return None, timestamps.tolist()
+        return data.tolist(), timestamps.tolist()
+
+
+def make_headsets(n_headsets, fs=256, realtime=True, drop_rate=0.0, seed=0,
+                  **kwargs):
+    """Create independent virtual headsets (one FakeInlet each)."""
+    return [FakeInlet(SyntheticEEG(fs=fs, seed=seed + i, **kwargs),
+                      realtime=realtime, drop_rate=drop_rate, seed=seed + i)
+            for i in range(n_headsets)]
+
+
+def run_outlet(args):
+    """Publish a synthetic headset as an LSL stream of type EEG."""
+    from pylsl import StreamInfo, StreamOutlet
+
+    source = SyntheticEEG(fs=args.fs, seed=args.seed)
+    info = StreamInfo('SyntheticMuse', 'EEG', source.n_channels, args.fs,
+                      'float32', 'synthetic%d' % args.seed)
+    channels = info.desc().append_child('channels')
+    for name in MUSE_CHANNELS[:source.n_channels]:
+        channels.append_child('channel').append_child_value('label', name)
+    outlet = StreamOutlet(info, PACKET_SIZE)
+
+    print('Streaming synthetic EEG, press Ctrl-C to stop.')
+    t0 = time.perf_counter()
+    try:
+        while True:
+            due = int((time.perf_counter() - t0) * args.fs)
+            n = due - source.n_generated
+            if n >= PACKET_SIZE:
+                n -= n % PACKET_SIZE
+                outlet.push_chunk(source.generate(n).tolist())
+            time.sleep(PACKET_SIZE / args.fs / 2)
+    except KeyboardInterrupt:
+        print('Closing!')
+
+
+def run_bench(args):
+    """Run many virtual headsets through the neurofeedback DSP path."""
+    import neurofeedback as nf
+
+    fs = args.fs
+    inlets = make_headsets(args.headsets, fs=fs, drop_rate=args.drop_rate,
+                           seed=args.seed)
+    pipelines = []
+    for inlet in inlets:
+        reader = acquisition.ChunkReader(inlet,
+                                         max_samples=int(nf.SHIFT_LENGTH * fs),
+                                         timeout=0.0,
+                                         max_gap=nf.MAX_GAP_LENGTH)
+        n_epochs = int(np.floor((nf.BUFFER_LENGTH - nf.EPOCH_LENGTH) /
+                                nf.SHIFT_LENGTH + 1))
+        tick = utils.TickWorkspace(int(fs * nf.BUFFER_LENGTH),
+                                   nf.EPOCH_LENGTH * fs, n_epochs,
+                                   len(nf.INDEX_CHANNEL), fs,
+                                   dtype=nf.DSP_DTYPE)
+        pipelines.append((reader, tick,
+                          acquisition.TickCounter(nf.SHIFT_LENGTH * fs)))
+
+    latencies = []
+    ticks = 0
+    end = time.perf_counter() + args.seconds
+    while time.perf_counter() < end:
+        for reader, tick, tick_counter in pipelines:
+            t0 = time.perf_counter()
+            eeg_data, _ = reader.read()
+            if eeg_data.shape[0] == 0:
+                continue
+            tick.add(eeg_data[:, nf.INDEX_CHANNEL])
+            if not tick_counter.add(eeg_data.shape[0]):
+                continue
+            tick.compute()
+            latencies.append(time.perf_counter() - t0)
+            ticks += 1
+        time.sleep(nf.PULL_TIMEOUT)
+
+    latencies_ms = np.array(latencies) * 1000
+    received = sum(p[0].n_received for p in pipelines)
+    filled = sum(p[0].n_missing for p in pipelines)
+    print('%d headsets, %d ticks in %.1f s' % (args.headsets, ticks,
+                                               args.seconds))
+    print('tick processing: median %.2f ms, p95 %.2f ms, max %.2f ms' % (
+        np.median(latencies_ms), np.percentile(latencies_ms, 95),
+        latencies_ms.max()))
+    print('samples received: %d, filled: %d, expected: %d' % (
+        received, filled, int(args.headsets * args.seconds * fs)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--fs', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=0)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('outlet', help='publish an LSL stream')
+    bench = commands.add_parser('bench', help='load test the DSP path')
+    bench.add_argument('--headsets', type=int, default=32)
+    bench.add_argument('--seconds', type=float, default=10)
+    bench.add_argument('--drop-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == 'outlet':
+        run_outlet(args)
+    else:
+        run_bench(args)
@@ -0,0 +1,158 @@
+import numpy as np
+
+import acquisition
+import utils
+
+
+FS = 256
+
+
+class ListInlet:
+    """Serves prepared (samples, timestamps) chunks, one per pull."""
+
+    def __init__(self, chunks, n_channels):
+        self.chunks = list(chunks)
+        self.n_channels = n_channels
+
+    def info(self, timeout=None):
+        return self
+
+    def nominal_srate(self):
+        return FS
+
+    def channel_count(self):
+        return self.n_channels
+
+    def channel_format(self):
+        return 2  # pylsl.cf_double64
+
+    def time_correction(self, timeout=None):
+        return 0.0
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024, dest_obj=None):
+        if not self.chunks:
+            return None, []
+        data, timestamps = self.chunks.pop(0)
+        dest_obj[:len(timestamps)] = data
+        return None, list(timestamps)
+
+
+def _ramp(start, n):
+    index = np.arange(start, start + n, dtype=np.float64)
+    return index[:, np.newaxis], index / FS
+
+
+def test_empty_pull():
+    reader = acquisition.ChunkReader(ListInlet([], 2), max_samples=12)
+    data, timestamps = reader.read()
+    assert data.shape == (0, 2)
+    assert timestamps.shape == (0,)
+    assert reader.n_received == 0
+
+
+def test_duplicate_and_overlapping_timestamps():
+    # A repeated timestamp inside the chunk and two samples already emitted
+    data, timestamps = _ramp(10, 6)
+    timestamps[3] = timestamps[2]
+    out, last, n_missing = acquisition.resample_chunk(
+        data, timestamps, FS, last_timestamp=11 / FS, last_sample=np.array([11.0]))
+
+    assert last * FS == 15
+    assert out.shape == (4, 1)
+    assert n_missing == 0
+    assert out[-1, 0] == 15
+
+    # Nothing newer than what was already emitted
+    out, last, _ = acquisition.resample_chunk(
+        data[:2], timestamps[:2], FS, last_timestamp=15 / FS)
+    assert out.shape == (0, 1)
+    assert last * FS == 15
+
+
+def test_clock_going_backwards_restarts_the_grid():
+    data, timestamps = _ramp(0, 12)
+    out, last, n_missing = acquisition.resample_chunk(
+        data, timestamps, FS, last_timestamp=100.0,
+        last_sample=np.array([0.0]), max_gap=0.5)
+    assert out.shape == (12, 1)
+    assert last == timestamps[-1]
+    assert n_missing == 0
+
+
+def test_short_gap_is_interpolated():
+    first, second = _ramp(0, 12), _ramp(15, 12)  # samples 12-14 lost
+    reader = acquisition.ChunkReader(ListInlet([first, second], 1),
+                                     max_samples=12, max_gap=0.5)
+    reader.read()
+    data, timestamps = reader.read()
+
+    assert reader.n_missing == 3
+    np.testing.assert_allclose(data[:, 0], np.arange(12, 27))
+    np.testing.assert_allclose(timestamps * FS, np.arange(12, 27))
+
+
+def test_long_gap_is_not_bridged():
+    first, second = _ramp(0, 12), _ramp(12 + FS, 12)  # one second lost
+    reader = acquisition.ChunkReader(ListInlet([first, second], 1),
+                                     max_samples=12, max_gap=0.5)
+    reader.read()
+    data, timestamps = reader.read()
+
+    assert reader.n_missing == 0
+    np.testing.assert_allclose(data[:, 0], np.arange(12 + FS, 24 + FS))
+    assert timestamps[0] * FS == 12 + FS
+
+
+def _stream(seconds, drop_rate=0.0, jitter=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    n = seconds * FS
+    t = np.arange(n) / FS
+    signal = (10 * np.sin(2 * np.pi * 2 * t) + 6 * np.sin(2 * np.pi * 6 * t)
+              + 8 * np.sin(2 * np.pi * 10 * t) + 3 * np.sin(2 * np.pi * 20 * t)
+              + rng.normal(0, 1, n))
+    data = np.stack([signal, -signal], axis=1)
+    timestamps = t + rng.normal(0, jitter, n) if jitter else t
+
+    chunks = []
+    for start in range(0, n, 12):
+        # Muse packets carry 12 samples; the first and last always arrive
+        lost = 0 < start < n - 12 and rng.random() < drop_rate
+        if not lost:
+            chunks.append((data[start:start + 12], timestamps[start:start + 12]))
+    return chunks
+
+
+def _band_powers(chunks):
+    reader = acquisition.ChunkReader(ListInlet(chunks, 2), max_samples=12,
+                                     max_gap=0.5)
+    parts = [reader.read()[0] for _ in range(len(chunks))]
+    data = np.concatenate(parts)
+    return reader, np.array([utils.compute_band_powers(data[i:i + FS], FS)
+                             for i in range(0, data.shape[0] - FS + 1, FS // 2)])
+
+
+def test_band_powers_survive_packet_loss_and_jitter():
+    _, lossless = _band_powers(_stream(20))
+    reader, lossy = _band_powers(_stream(20, drop_rate=0.05, jitter=1e-4))
+
+    assert reader.n_missing > 0
+    # Every lost sample was filled, so the epochs line up
+    assert lossy.shape == lossless.shape
+    error = np.abs(lossy - lossless)
+    assert error.mean() < 0.04
+    # A lost 12-sample packet cannot be recovered above ~10 Hz, so beta
+    # (the last two columns) gets the loosest bound
+    assert error[:, :6].max() < 0.15
+    assert error.max() < 0.35
+
+
+def test_tick_counter_follows_samples_not_pulls():
+    counter = acquisition.TickCounter(51)
+    # One 12-sample packet per pull: a tick every 51 samples on average
+    ticks = [counter.add(12) for _ in range(51)]
+    assert sum(ticks) == 12
+    assert ticks[:5] == [False, False, False, False, True]
+
+    # A stall delivers several shifts at once, but only one tick
+    assert counter.add(5 * 51)
+    assert not counter.add(0)
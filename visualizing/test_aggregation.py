@@ -0,0 +1,67 @@
+import numpy as np
+
+import aggregation
+
+
+def _session(n_ticks=600, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal([0.5, 0.6, 0.7, 0.3, 1.2], 0.05, (n_ticks, 5))
+    ptp = rng.uniform(40, 80, n_ticks)
+    # Blinks: huge raw amplitude and inflated band powers
+    values[::40] += 3
+    ptp[::40] = 400
+    # A zero-power band
+    values[5, aggregation.BETA] = -np.inf
+    return values, ptp
+
+
+def test_artifacts_do_not_dominate_summary():
+    values, ptp = _session()
+    series = aggregation.BandPowerSeries(capacity=8, max_ptp=200)
+    for row, amplitude in zip(values, ptp):
+        series.append(row, ptp=amplitude)
+
+    summary = series.summarize()
+    assert len(series) == 600
+    assert summary['n_rejected'] >= 16
+    np.testing.assert_allclose(summary['trimmed_mean'],
+                               [0.5, 0.6, 0.7, 0.3, 1.2], atol=0.01)
+    np.testing.assert_allclose(summary['median'],
+                               [0.5, 0.6, 0.7, 0.3, 1.2], atol=0.01)
+
+
+def test_z_score_rejection_without_amplitude_thresholds():
+    values, _ = _session()
+    series = aggregation.BandPowerSeries()
+    for row in values:
+        series.append(row)
+
+    keep = series.clean_mask()
+    assert not keep[::40].any()
+    assert not keep[5]
+
+
+def test_online_summary_tracks_batch_summary():
+    values, ptp = _session(n_ticks=2000)
+    series = aggregation.BandPowerSeries(max_ptp=200)
+    online = aggregation.OnlineBandSummary(max_ptp=200)
+    for row, amplitude in zip(values, ptp):
+        series.append(row, ptp=amplitude)
+        online.update(row, ptp=amplitude)
+
+    batch, streaming = series.summarize(), online.summarize()
+    np.testing.assert_allclose(streaming['median'], batch['median'],
+                               atol=0.01)
+    np.testing.assert_allclose(streaming['trimmed_mean'],
+                               batch['trimmed_mean'], atol=0.01)
+    assert streaming['n_rejected'] >= 50
+
+
+def test_p2_quantile():
+    rng = np.random.default_rng(1)
+    samples = rng.exponential(size=(20000, 3))
+    estimator = aggregation.P2Quantile(0.9, 3)
+    for row in samples:
+        estimator.update(row)
+    np.testing.assert_allclose(estimator.value,
+                               np.quantile(samples, 0.9, axis=0), rtol=0.02)
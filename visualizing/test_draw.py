@@ -0,0 +1,53 @@
+import json
+import os
+import time
+
+import pytest
+import requests
+
+import draw
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(draw, 'expanded2', str(tmp_path))
+    return tmp_path
+
+
+def _status(static_dir):
+    with open(os.path.join(static_dir, draw.STATUS_FILE)) as f:
+        return json.load(f)
+
+
+def test_slow_preview_does_not_hold_back_final(static_dir, stub_api):
+    stub_api.delays[draw.preview_engine_id] = 1.5
+
+    start = time.monotonic()
+    draw.generate('a prompt')
+    assert time.monotonic() - start < 1.0
+    assert _status(static_dir)['stage'] == 'final'
+
+    # The late preview must not replace the final image
+    time.sleep(2)
+    assert _status(static_dir)['stage'] == 'final'
+    assert not os.path.exists(os.path.join(static_dir, draw.PREVIEW_IMAGE))
+
+
+def test_preview_is_published_before_slow_final(static_dir, stub_api):
+    stub_api.delays[draw.engine_id] = 0.5
+
+    draw.generate('a prompt')
+
+    with open(os.path.join(static_dir, draw.PREVIEW_IMAGE), 'rb') as f:
+        assert f.read() == b'a prompt'
+    assert _status(static_dir) == {'stage': 'final', 'image': draw.FINAL_IMAGE,
+                                   'updated': pytest.approx(time.time(), abs=5)}
+
+
+def test_stalled_request_times_out(stub_api):
+    stub_api.delays[draw.engine_id] = 2
+
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        draw.text_to_image('a prompt', draw.engine_id, 64, 64, 1, timeout=0.2)
+    assert time.monotonic() - start < 1.5
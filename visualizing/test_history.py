@@ -0,0 +1,28 @@
+import history
+
+
+class BrokenWriter:
+    def add(self, *values):
+        raise RuntimeError('no such table: generateImage_bandpower')
+
+    def finish(self, prompt, category):
+        raise AssertionError('not called after a failure')
+
+
+def test_database_errors_do_not_end_the_session(monkeypatch, capsys):
+    def setup():
+        raise RuntimeError('no such table: generateImage_session')
+    monkeypatch.setattr(history, 'setup', setup)
+
+    recorder = history.start_session()
+    recorder.add(0, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5)
+    recorder.finish('a prompt', '110')
+    assert capsys.readouterr().out.count('Session not recorded') == 1
+
+    # A failure halfway through stops recording, once
+    recorder.writer = BrokenWriter()
+    for tick in range(3):
+        recorder.add(tick, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5)
+    recorder.finish('a prompt', '110')
+    recorder.close()
+    assert capsys.readouterr().out.count('Session not recorded') == 1
@@ -0,0 +1,115 @@
+import os
+import subprocess
+import sys
+import uuid
+
+import numpy as np
+
+import acquisition
+import shared_ring
+import synthetic
+
+
+def _ring(capacity=100, n_channels=3, fs=256):
+    name = 'test_ring_' + uuid.uuid4().hex[:8]
+    return shared_ring.SharedRingBuffer.create(name, capacity, n_channels, fs)
+
+
+def _samples(start, n, n_channels=3):
+    index = np.arange(start, start + n, dtype=np.float32)
+    return np.repeat(index[:, np.newaxis], n_channels, axis=1), index / 256.0
+
+
+def test_latest_is_contiguous_across_wrap_around():
+    with _ring() as ring:
+        seq = 0
+        for n in (30, 50, 45, 12, 99):
+            ring.write(*_samples(seq, n))
+            seq += n
+
+        data, timestamps, end = ring.latest(100)
+        assert end == seq == ring.seq
+        np.testing.assert_array_equal(data[:, 0], np.arange(seq - 100, seq))
+        np.testing.assert_allclose(timestamps * 256, np.arange(seq - 100, seq))
+        # A view into shared memory, not a copy
+        assert not data.flags.owndata and not data.flags.writeable
+        assert ring.is_intact(seq - 100)
+
+        ring.write(*_samples(seq, 1))
+        assert not ring.is_intact(seq - 100)
+
+
+def test_reader_gets_every_sample_and_counts_losses():
+    with _ring() as ring:
+        reader = shared_ring.RingReader(ring)
+        ring.write(*_samples(0, 60))
+        data, _ = reader.pull_chunk(max_samples=40)
+        assert np.array(data)[:, 0].tolist() == list(range(40))
+
+        ring.write(*_samples(60, 150))  # laps the reader
+        data, _ = reader.pull_chunk(max_samples=1000)
+        assert np.array(data)[:, 0].tolist() == list(range(110, 210))
+        assert reader.n_lost == 70
+
+
+def test_reader_hands_out_views():
+    with _ring() as ring:
+        reader = shared_ring.RingReader(ring)
+        ring.write(*_samples(0, 60))
+        data, timestamps, first_seq = reader.read(40)
+
+        assert first_seq == 0
+        assert data[:, 0].tolist() == list(range(40))
+        assert not data.flags.owndata and not timestamps.flags.owndata
+        assert ring.is_intact(first_seq)
+
+        ring.write(*_samples(60, 100))  # overwrites the view
+        assert not ring.is_intact(first_seq)
+        assert reader.info().nominal_srate() == ring.fs
+
+
+def test_reader_works_as_chunk_reader_inlet():
+    with _ring(capacity=2048, n_channels=5) as ring:
+        inlet = synthetic.FakeInlet(synthetic.SyntheticEEG(seed=2),
+                                    realtime=False)
+        produced = []
+
+        def stop():
+            produced.append(ring.seq)
+            return len(produced) > 3
+
+        consumer = acquisition.ChunkReader(shared_ring.RingReader(ring),
+                                           max_samples=2048)
+        shared_ring.produce(inlet, ring, stop=stop)
+        data, _ = consumer.read()
+
+        assert data.shape == (ring.seq, 5)
+        assert consumer.n_missing == 0
+
+
+# Runs in a separate interpreter, with a resource tracker of its own
+CONSUMER = """
+import sys
+import shared_ring
+ring = shared_ring.SharedRingBuffer.attach(sys.argv[1])
+data, _, _ = ring.latest(int(sys.argv[2]))
+print(float(data.sum()))
+del data
+ring.close()
+"""
+
+
+def test_other_processes_see_the_samples():
+    with _ring() as ring:
+        ring.write(*_samples(0, 80))
+        name = ring._shm.name
+        def consume(n_samples):
+            result = subprocess.run(
+                [sys.executable, '-c', CONSUMER, name, str(n_samples)],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True, text=True, timeout=60, check=True)
+            return float(result.stdout)
+
+        assert consume(50) == 3 * sum(range(30, 80))
+        # The first consumer exiting must not remove the segment
+        assert consume(1) == 3 * 79
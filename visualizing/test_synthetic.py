@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+
+import acquisition
+import synthetic
+import utils
+
+
+FS = 256
+
+
+def test_output_does_not_depend_on_chunking():
+    whole = synthetic.SyntheticEEG(seed=3, blink_rate=1, clench_rate=1)
+    chunked = synthetic.SyntheticEEG(seed=3, blink_rate=1, clench_rate=1)
+
+    expected = whole.generate(10 * FS)
+    sizes = [1, 12, 500, 7, 1024, 12]
+    parts = [chunked.generate(n) for n in sizes]
+    parts.append(chunked.generate(10 * FS - sum(sizes)))
+
+    np.testing.assert_array_equal(np.concatenate(parts), expected)
+
+
+def test_band_oscillations_show_in_band_powers():
+    source = synthetic.SyntheticEEG(
+        seed=0, bands={'alpha': (10.0, 40.0)}, blink_rate=0, clench_rate=0)
+    data = source.generate(FS).astype(np.float64)
+    features = utils.compute_band_powers(data, FS)
+
+    n_channels = source.n_channels
+    delta, theta, alpha, beta = features.reshape(4, n_channels)
+    assert (alpha > theta + 0.5).all()
+    assert (alpha > beta + 0.5).all()
+
+
+def test_reader_fills_dropped_packets():
+    source = synthetic.SyntheticEEG(seed=1)
+    inlet = synthetic.FakeInlet(source, realtime=False, drop_rate=0.2,
+                                jitter=1e-4, time_offset=2.0)
+    reader = acquisition.ChunkReader(inlet, max_samples=51)
+
+    n_samples = 0
+    for _ in range(100):
+        data, _ = reader.read()
+        n_samples += data.shape[0]
+
+    assert inlet.n_dropped > 0
+    assert reader.n_missing > 0
+    # Every generated sample has a slot, except at most the trailing packet
+    assert source.n_generated - n_samples <= synthetic.PACKET_SIZE
+
+
+def test_many_headsets_are_independent():
+    inlets = synthetic.make_headsets(16, realtime=False)
+    chunks = [np.array(inlet.pull_chunk(max_samples=FS)[0])
+              for inlet in inlets]
+    assert len({chunk.tobytes() for chunk in chunks}) == 16
+
+
+def test_realtime_pulls_wait_like_liblsl():
+    inlet = synthetic.FakeInlet(synthetic.SyntheticEEG(seed=4))
+
+    # Short timeout: whatever whole packets arrived within it
+    reader = acquisition.ChunkReader(inlet, max_samples=51, timeout=0.05)
+    sizes = [reader.read()[0].shape[0] for _ in range(10)]
+    assert all(n % synthetic.PACKET_SIZE == 0 for n in sizes)
+    assert np.mean(sizes) >= synthetic.PACKET_SIZE
+
+    # Long timeout: returns as soon as "max_samples" are in
+    reader = acquisition.ChunkReader(inlet, max_samples=51, timeout=1.0)
+    start = time.perf_counter()
+    sizes = [reader.read()[0].shape[0] for _ in range(3)]
+    assert sizes == [51, 51, 51]
+    assert time.perf_counter() - start < 1.0
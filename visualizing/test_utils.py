@@ -0,0 +1,148 @@
+import tracemalloc
+
+import numpy as np
+
+import aggregation
+import utils
+
+
+FS = 256
+
+
+def _random_epochs(n_epochs=20, n_channels=4, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(FS) / FS
+    for _ in range(n_epochs):
+        alpha = np.sin(2 * np.pi * 10 * t + rng.uniform(0, 2 * np.pi))
+        noise = rng.normal(0, 10, (FS, n_channels))
+        yield 800 + 20 * alpha[:, np.newaxis] + noise
+
+
+def test_float32_workspace_matches_float64_path():
+    workspace = utils.BandPowerWorkspace(FS, 4, FS, dtype=np.float32)
+    for epoch in _random_epochs():
+        expected = utils.compute_band_powers(epoch, FS)
+        result = workspace.compute(epoch.astype(np.float32))
+        assert result.dtype == np.float32
+        # log10 band powers: 1e-3 is well below the tick-to-tick variation
+        np.testing.assert_allclose(result, expected, rtol=0, atol=1e-3)
+
+
+def test_float64_workspace_matches_exactly():
+    workspace = utils.BandPowerWorkspace(FS, 4, FS, dtype=np.float64)
+    for epoch in _random_epochs():
+        np.testing.assert_allclose(workspace.compute(epoch),
+                                   utils.compute_band_powers(epoch, FS),
+                                   rtol=1e-10)
+
+
+def test_workspace_does_not_allocate_after_warm_up():
+    workspace = utils.BandPowerWorkspace(FS, 4, FS, dtype=np.float32)
+    epochs = list(_random_epochs(5))
+    epochs32 = [e.astype(np.float32) for e in epochs]
+    workspace.compute(epochs32[0])
+    utils.compute_band_powers(epochs[0], FS)
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        for epoch in epochs32:
+            result = workspace.compute(epoch)
+        after, workspace_peak = tracemalloc.get_traced_memory()
+
+        tracemalloc.reset_peak()
+        for epoch in epochs:
+            utils.compute_band_powers(epoch, FS)
+        _, float64_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Nothing is kept between calls, the output buffer is reused, and the
+    # only transient memory is numpy's internal FFT/ufunc scratch space
+    assert after - before < 1024
+    assert result is workspace.compute(epochs32[0])
+    assert workspace_peak < float64_peak / 2
+
+
+def _chunks(n_chunks=60, size=51, seed=1):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_chunks):
+        yield rng.normal(800, 20, (size, 1))
+
+
+def test_tick_workspace_matches_update_buffer_path():
+    tick = utils.TickWorkspace(5 * FS, FS, 21, 1, FS, dtype=np.float64)
+    eeg_buffer = np.zeros((5 * FS, 1))
+    band_buffer = np.zeros((21, 4))
+    filter_state = None
+
+    for chunk in _chunks():
+        eeg_buffer, filter_state = utils.update_buffer(
+            eeg_buffer, chunk, notch=True, filter_state=filter_state)
+        epoch = utils.get_last_data(eeg_buffer, FS)
+        band_buffer, _ = utils.update_buffer(
+            band_buffer, np.asarray([utils.compute_band_powers(epoch, FS)]))
+
+        tick.add(chunk)
+        np.testing.assert_allclose(tick.epoch(), epoch, rtol=1e-12)
+        tick.compute()
+        np.testing.assert_allclose(tick.smooth, band_buffer.mean(axis=0),
+                                   rtol=1e-10)
+        np.testing.assert_allclose(tick.workspace.ptp[0], np.ptp(epoch))
+        np.testing.assert_allclose(tick.workspace.var[0], np.var(epoch))
+
+
+def test_tick_does_not_allocate_after_warm_up():
+    tick = utils.TickWorkspace(5 * FS, FS, 21, 1, FS, dtype=np.float32)
+    # Single precision covers the EEG buffer, not only the FFT
+    assert tick.epoch().dtype == tick.smooth.dtype == np.float32
+    session = aggregation.BandPowerSeries(capacity=512)
+    features = np.zeros(len(aggregation.FEATURES))
+    chunks = list(_chunks(n_chunks=200, size=51))
+
+    def run(chunk):
+        # Same steps as a neurofeedback.py tick after acquisition
+        tick.add(chunk)
+        band_powers = tick.compute(tick.epoch())
+        features[:4] = band_powers[0:4]
+        features[4] = tick.smooth[2] / tick.smooth[0]
+        session.append(features, ptp=tick.workspace.ptp.max(),
+                       var=tick.workspace.var.max())
+
+    buffers = [np.zeros((5 * FS, 1)), np.zeros((21, 4)), None]
+
+    def run_copying(chunk):
+        # The tick as it was before TickWorkspace
+        eeg_buffer, band_buffer, filter_state = buffers
+        eeg_buffer, filter_state = utils.update_buffer(
+            eeg_buffer, chunk, notch=True, filter_state=filter_state)
+        epoch = utils.get_last_data(eeg_buffer, FS)
+        band_powers = utils.compute_band_powers(epoch, FS)
+        band_buffer, _ = utils.update_buffer(band_buffer,
+                                             np.asarray([band_powers]))
+        np.mean(band_buffer, axis=0)
+        np.ptp(epoch), np.var(epoch)
+        buffers[:] = eeg_buffer, band_buffer, filter_state
+
+    for chunk in chunks[:20]:
+        run(chunk)
+        run_copying(chunk)
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        for chunk in chunks[20:]:
+            run(chunk)
+        after, tick_peak = tracemalloc.get_traced_memory()
+
+        tracemalloc.reset_peak()
+        for chunk in chunks[20:]:
+            run_copying(chunk)
+        _, copying_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Nothing accumulates across ticks, and no buffer or epoch is copied:
+    # what remains is scratch space inside lfilter and numpy's FFT
+    assert after - before < 1024
+    assert tick_peak - before < (copying_peak - before) / 2
@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+import draw
+import prompts
+import warmup
+
+
+def _scheduler(tmp_path, categories=(), clock=None, **kwargs):
+    options = dict(recent_categories=lambda limit: list(categories)[:limit],
+                   busy_file=str(tmp_path / 'pipeline.busy'),
+                   min_interval=0, idle_after=0)
+    if clock is not None:
+        options['clock'] = clock
+    options.update(kwargs)
+    cache = warmup.ImageCache(str(tmp_path / 'warm'))
+    return warmup.WarmupScheduler(cache, seed=0, **options)
+
+
+def test_distribution_follows_past_sessions():
+    assert set(warmup.category_distribution([]).values()) \
+        == {1 / len(prompts.CATEGORIES)}
+
+    distribution = warmup.category_distribution(['110'] * 12 + ['001'] * 4)
+    assert max(distribution, key=distribution.get) == '110'
+    assert distribution['110'] > distribution['001'] > distribution['000'] > 0
+    assert sum(distribution.values()) == pytest.approx(1)
+
+
+def test_scheduler_fills_stock_by_likelihood(tmp_path, stub_api):
+    scheduler = _scheduler(tmp_path, categories=['110'] * 40, stock_size=4)
+
+    rendered = [scheduler.step() for _ in range(6)]
+
+    assert rendered[:4] == ['110', '110', '110', '110']
+    assert rendered[4:] == [None, None]
+    assert len(stub_api.requests) == 4
+    # Warmed images are full renders, so they can stand in for the final one
+    assert {(path, width) for path, width, _ in stub_api.requests} \
+        == {('/v1/generation/%s/text-to-image' % draw.engine_id, 1024)}
+
+
+def test_scheduler_waits_for_idle_rate_limit_and_budget(tmp_path, stub_api):
+    now = [0.0]
+    scheduler = _scheduler(tmp_path, clock=lambda: now[0], idle_after=30,
+                           min_interval=60, max_bytes=1)
+    busy = tmp_path / 'pipeline.busy'
+
+    busy.touch()
+    assert scheduler.step() is None
+    busy.unlink()
+    now[0] = 10
+    assert scheduler.step() is None  # a session may follow right away
+    now[0] = 40
+    assert scheduler.step() is not None
+    now[0] = 50
+    assert scheduler.step() is None  # rate limited
+    now[0] = 200
+    assert scheduler.step() is None  # over the disk budget
+
+    assert len(stub_api.requests) == 1
+
+
+def test_draw_serves_cached_image_without_rendering(tmp_path, stub_api,
+                                                    monkeypatch):
+    monkeypatch.setattr(draw, 'expanded2', str(tmp_path))
+    monkeypatch.setattr(draw, 'preview_enabled', False)
+    cache = warmup.ImageCache(str(tmp_path / 'warm'))
+    cache.put('101', b'warm image', 'warm prompt')
+
+    shown = draw.generate('session prompt', '101', cache)
+
+    assert shown == 'warm prompt'
+    assert stub_api.requests == []
+    with open(os.path.join(tmp_path, draw.FINAL_IMAGE), 'rb') as f:
+        assert f.read() == b'warm image'
+    with open(os.path.join(tmp_path, draw.STATUS_FILE)) as f:
+        assert json.load(f)['stage'] == 'final'
+    assert cache.stock()['101'] == 0
+
+    # Cache miss: rendered as before
+    assert draw.generate('session prompt', '101', cache) == 'session prompt'
+    assert len(stub_api.requests) == 1
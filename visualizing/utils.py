@@ -108,6 +108,205 @@ def compute_band_powers(eegdata, fs):
     return feature_vector
 
 
+class BandPowerWorkspace:
+    """Allocation-free version of compute_band_powers.
+
+    All intermediate arrays (the centred and windowed epoch, the spectrum and
+    the feature vector) are allocated once and written in place on every
+    call, so no new arrays are created per epoch. The real FFT is used instead
+    of the complex one. With dtype=np.float32 the whole computation runs in
+    single precision, which halves memory traffic on small kiosk machines.
+
+    The array returned by compute() is reused on the next call: copy it if it
+    has to be kept. Each call also leaves the peak-to-peak amplitude and the
+    variance of every channel of the epoch in "ptp" and "var".
+
+    Args:
+        win_sample_length (int): number of samples in each epoch
+        n_channels (int): number of channels in each epoch
+        fs (float): sampling frequency of the epochs
+        dtype (numpy.dtype): np.float32 or np.float64
+    """
+
+    def __init__(self, win_sample_length, n_channels, fs, dtype=np.float32):
+        self.win_sample_length = int(win_sample_length)
+        self.n_channels = int(n_channels)
+        self.dtype = np.dtype(dtype)
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+
+        NFFT = nextpow2(self.win_sample_length)
+        self.nfft = NFFT
+
+        # Channels are stored along the first axis so the FFT runs over
+        # contiguous memory. Samples past win_sample_length stay zero and act
+        # as the zero padding of the FFT.
+        self._window = np.hamming(self.win_sample_length).astype(self.dtype)
+        self._mean = np.zeros(self.n_channels, dtype=self.dtype)
+        self._padded = np.zeros((self.n_channels, NFFT), dtype=self.dtype)
+        self._centred = self._padded[:, :self.win_sample_length]
+        self._spectrum = np.zeros((self.n_channels, NFFT // 2 + 1),
+                                  dtype=complex_dtype)
+        self._psd = np.zeros((self.n_channels, NFFT // 2 + 1),
+                             dtype=self.dtype)
+        self._features = np.zeros(4 * self.n_channels, dtype=self.dtype)
+        self._min = np.zeros(self.n_channels, dtype=self.dtype)
+        self._squared = np.zeros_like(self._centred)
+        self.ptp = np.zeros(self.n_channels, dtype=self.dtype)
+        self.var = np.zeros(self.n_channels, dtype=self.dtype)
+
+        # Same frequency bins as compute_band_powers
+        f = fs / 2 * np.linspace(0, 1, int(NFFT / 2))
+        masks = [f < 4, (f >= 4) & (f <= 8), (f >= 8) & (f <= 12),
+                 (f >= 12) & (f < 30)]
+        self._bands = []
+        for mask in masks:
+            ind, = np.where(mask)
+            self._bands.append((ind[0], ind[-1] + 1))
+
+        self._rfft_out = _rfft_supports_out()
+
+    def compute(self, eegdata):
+        """Extract the band powers from one epoch.
+
+        Args:
+            eegdata (numpy.ndarray): array of dimension [number of samples,
+                number of channels]
+
+        Returns:
+            (numpy.ndarray): feature vector [delta, theta, alpha, beta] for
+                each channel, in the same layout as compute_band_powers
+        """
+        data = eegdata.T
+        nbCh = self.n_channels
+
+        np.mean(data, axis=1, out=self._mean)
+        np.subtract(data, self._mean[:, np.newaxis], out=self._centred)
+
+        # Amplitude statistics for artifact rejection, before windowing
+        np.max(self._centred, axis=1, out=self.ptp)
+        np.min(self._centred, axis=1, out=self._min)
+        np.subtract(self.ptp, self._min, out=self.ptp)
+        np.square(self._centred, out=self._squared)
+        np.mean(self._squared, axis=1, out=self.var)
+
+        np.multiply(self._centred, self._window, out=self._centred)
+
+        if self._rfft_out:
+            np.fft.rfft(self._padded, axis=1, out=self._spectrum)
+        else:
+            self._spectrum[...] = np.fft.rfft(self._padded, axis=1)
+        np.abs(self._spectrum, out=self._psd)
+
+        for i, (start, stop) in enumerate(self._bands):
+            np.mean(self._psd[:, start:stop], axis=1,
+                    out=self._features[i * nbCh:(i + 1) * nbCh])
+
+        # PSD = 2 * |Y| / winSampleLength, applied once to the band means
+        self._features *= 2.0 / self.win_sample_length
+        np.log10(self._features, out=self._features)
+
+        return self._features
+
+
+def write_mirrored(buffer, start, values):
+    """Write "values" into a mirrored ring buffer, starting at row "start".
+
+    "buffer" holds every row twice, half its length apart, so that any window
+    of up to half its length is one contiguous slice. "values" must not be
+    longer than that.
+
+    Args:
+        buffer (numpy.ndarray): ring of 2 * capacity rows
+        start (int): row the first value goes to, below capacity
+        values (numpy.ndarray): rows to write
+    """
+    capacity = buffer.shape[0] // 2
+    n = values.shape[0]
+    first = min(n, capacity - start)
+    for offset in (0, capacity):
+        buffer[start + offset:start + offset + first] = values[:first]
+        if first < n:
+            buffer[offset:offset + n - first] = values[first:]
+
+
+class TickWorkspace:
+    """Preallocated state of one neurofeedback tick.
+
+    Replaces the update_buffer / get_last_data / compute_band_powers sequence
+    with buffers that are written in place. The EEG buffer is mirrored: each
+    sample is stored twice, "buffer_length" rows apart, so that the newest
+    epoch is always one contiguous view and nothing has to be shifted. The
+    band power buffer is only ever averaged, so it is a plain circular buffer.
+
+    After the first call, a tick allocates only the output of the notch
+    filter (scipy's lfilter has no "out" argument). All buffers use "dtype",
+    the filter state excepted.
+
+    Args:
+        buffer_length (int): number of samples kept in the EEG buffer
+        epoch_length (int): number of samples in each epoch
+        n_epochs (int): number of band power vectors averaged into "smooth"
+        n_channels (int): number of channels
+        fs (float): sampling frequency
+        dtype (numpy.dtype): precision of the band power computation
+    """
+
+    def __init__(self, buffer_length, epoch_length, n_epochs, n_channels, fs,
+                 dtype=np.float32):
+        self.buffer_length = int(buffer_length)
+        self.epoch_length = int(epoch_length)
+        self._eeg = np.zeros((2 * self.buffer_length, n_channels), dtype=dtype)
+        self._pos = 0
+        self.filter_state = np.tile(lfilter_zi(NOTCH_B, NOTCH_A),
+                                    (n_channels, 1)).T
+
+        self.workspace = BandPowerWorkspace(epoch_length, n_channels, fs,
+                                            dtype=dtype)
+        self._bands = np.zeros((int(n_epochs), 4 * n_channels), dtype=dtype)
+        self._band_pos = 0
+        self.smooth = np.zeros(4 * n_channels, dtype=dtype)
+
+    def add(self, new_data):
+        """Notch-filter "new_data" [n_samples, n_channels] into the buffer."""
+        new_data, self.filter_state = lfilter(NOTCH_B, NOTCH_A, new_data,
+                                              axis=0, zi=self.filter_state)
+        n = new_data.shape[0]
+        if n > self.buffer_length:
+            new_data, n = new_data[-self.buffer_length:], self.buffer_length
+        write_mirrored(self._eeg, self._pos, new_data)
+        self._pos = (self._pos + n) % self.buffer_length
+
+    def epoch(self):
+        """(numpy.ndarray): view of the newest "epoch_length" samples"""
+        end = self._pos + self.buffer_length
+        return self._eeg[end - self.epoch_length:end]
+
+    def compute(self, data_epoch=None):
+        """Band powers of an epoch (the newest one by default).
+
+        The mean over the last "n_epochs" results is updated in "smooth".
+        Like BandPowerWorkspace.compute, the returned array is reused.
+        """
+        if data_epoch is None:
+            data_epoch = self.epoch()
+        band_powers = self.workspace.compute(data_epoch)
+        self._bands[self._band_pos] = band_powers
+        self._band_pos = (self._band_pos + 1) % self._bands.shape[0]
+        np.mean(self._bands, axis=0, out=self.smooth)
+        return band_powers
+
+
+def _rfft_supports_out():
+    """
+    Check whether np.fft.rfft accepts "out" (numpy >= 2.0)
+    """
+    try:
+        np.fft.rfft(np.zeros(2), out=np.zeros(2, dtype=complex))
+    except TypeError:
+        return False
+    return True
+
+
 def nextpow2(i):
     """
     Find the next power of 2 for number i
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Background Warm-Up of the Image Cache
+
+Prompts come from a handful of categories (see prompts.py), so an image
+rendered ahead of time for a category can be shown to the next session that
+lands in it instead of making the visitor wait for a full render. This
+scheduler uses the time between sessions to keep a small stock of images per
+category, sized by how often each category came up in past sessions.
+
+    python warmup.py                 # next to the web app, runs until Ctrl-C
+    python warmup.py --once          # generate at most one image and exit
+
+It only renders while no pipeline job is running (the web app keeps
+BUSY_FILE while one is), at most one image per "min_interval" seconds, and
+stops adding images once the cache uses "max_bytes" of disk.
+
+"""
+
+import argparse
+import os
+import random
+import time
+
+import prompts
+
+
+STATIC_DIR = os.path.expanduser('~/EEGImage/EEGImage/generateImage/static/')
+
+# One directory per category, each image with its prompt next to it
+CACHE_DIR = os.path.join(STATIC_DIR, 'warm')
+
+# Present while the web app runs a pipeline job
+BUSY_FILE = os.path.join(STATIC_DIR, 'pipeline.busy')
+
+
+def category_distribution(categories, smoothing=1.0):
+    """Probability of each prompt category in the next session.
+
+    Laplace smoothing keeps every category possible, and gives a uniform
+    distribution without any history.
+
+    Args:
+        categories (list): categories of past sessions
+        smoothing (float): pseudo-count added to every category
+
+    Returns:
+        (dict): category -> probability
+    """
+    counts = dict.fromkeys(prompts.CATEGORIES, 0)
+    for category in categories:
+        if category in counts:
+            counts[category] += 1
+
+    total = sum(counts.values()) + smoothing * len(counts)
+    return {category: (count + smoothing) / total
+            for category, count in counts.items()}
+
+
+class ImageCache:
+    """Pre-rendered images on disk, one directory per prompt category.
+
+    Images are written under a temporary name and renamed into place, so the
+    scheduler and draw.py can share the directory without locking.
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def _images(self, category):
+        folder = os.path.join(self.directory, category)
+        try:
+            names = os.listdir(folder)
+        except FileNotFoundError:
+            return []
+        # Names are creation times, so this is oldest first
+        return sorted(os.path.join(folder, name) for name in names
+                      if name.endswith('.png'))
+
+    def put(self, category, image, prompt):
+        folder = os.path.join(self.directory, category)
+        os.makedirs(folder, exist_ok=True)
+        base = os.path.join(folder, '%020d' % time.time_ns())
+        with open(base + '.txt', 'w') as f:
+            f.write(prompt)
+        tmp = os.path.join(folder, '.' + os.path.basename(base) + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(image)
+        os.replace(tmp, base + '.png')
+
+    def take(self, category, destination):
+        """Move the oldest image of a category to "destination".
+
+        Returns:
+            (str): the prompt the image was rendered from, None on a miss
+        """
+        for path in self._images(category):
+            base = path[:-len('.png')]
+            try:
+                with open(base + '.txt') as f:
+                    prompt = f.read()
+                os.replace(path, destination)
+            except FileNotFoundError:
+                # Taken by another process in the meantime
+                continue
+            _remove(base + '.txt')
+            return prompt
+        return None
+
+    def evict(self, category):
+        """Delete the oldest image of a category."""
+        for path in self._images(category):
+            _remove(path)
+            _remove(path[:-len('.png')] + '.txt')
+            return
+
+    def stock(self):
+        """(dict): category -> number of ready images"""
+        return {category: len(self._images(category))
+                for category in prompts.CATEGORIES}
+
+    def size(self):
+        """(int): bytes used by the cache"""
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+        return total
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def render_final(prompt):
+    """Render at the same engine and size as draw.generate()."""
+    import draw
+    return draw.text_to_image(prompt, draw.engine_id, 1024, 1024, 30)
+
+
+class WarmupScheduler:
+    """Decides when and for which category to render the next image.
+
+    Args:
+        cache (ImageCache): where rendered images go
+        render (callable): prompt -> PNG bytes
+        recent_categories (callable): limit -> categories of the latest
+            sessions; defaults to the web app's database
+        busy_file (str): rendering waits while this file exists
+        stock_size (int): images to keep ready across all categories
+        max_bytes (int): disk budget of the cache
+        min_interval (float): seconds between two render requests
+        idle_after (float): seconds without a job before rendering starts
+        busy_timeout (float): a busy file not touched for this long is left
+            over from a crash and ignored; the web app touches it whenever a
+            job is submitted, starts or finishes
+        history (int): number of recent sessions the distribution uses
+    """
+
+    def __init__(self, cache, render=render_final, recent_categories=None,
+                 busy_file=BUSY_FILE, stock_size=8, max_bytes=100 * 2**20,
+                 min_interval=60.0, idle_after=30.0, busy_timeout=600.0,
+                 history=200, clock=time.monotonic, seed=None):
+        self.cache = cache
+        self.render = render
+        if recent_categories is None:
+            from history import recent_categories
+        self.recent_categories = recent_categories
+        self.busy_file = busy_file
+        self.stock_size = stock_size
+        self.max_bytes = max_bytes
+        self.min_interval = min_interval
+        self.idle_after = idle_after
+        self.busy_timeout = busy_timeout
+        self.history = history
+        self.clock = clock
+        self.rng = random.Random(seed)
+
+        self._last_busy = None
+        self._last_render = None
+
+    def idle(self):
+        """True once no job has been running for "idle_after" seconds."""
+        now = self.clock()
+        try:
+            age = time.time() - os.stat(self.busy_file).st_mtime
+        except FileNotFoundError:
+            age = None
+        if age is not None and age < self.busy_timeout:
+            self._last_busy = now
+            return False
+        return self._last_busy is None or now - self._last_busy >= self.idle_after
+
+    def next_category(self):
+        """Category most short of its share of the stock, None if full."""
+        stock = self.cache.stock()
+        if sum(stock.values()) >= self.stock_size:
+            return None
+        distribution = category_distribution(
+            self.recent_categories(self.history))
+        deficit = {category: self.stock_size * p - stock[category]
+                   for category, p in distribution.items()}
+        return max(deficit, key=deficit.get)
+
+    def _make_room(self, needed):
+        # Over budget: drop an image of the most overstocked category, if
+        # one holds more than its share
+        distribution = category_distribution(
+            self.recent_categories(self.history))
+        stock = self.cache.stock()
+        surplus = {category: stock[category] - self.stock_size * p
+                   for category, p in distribution.items()}
+        category = max(surplus, key=surplus.get)
+        if category == needed or surplus[category] <= 0:
+            return False
+        self.cache.evict(category)
+        return True
+
+    def step(self):
+        """Render one image if allowed now.
+
+        Returns:
+            (str): category of the rendered image, None if nothing was done
+        """
+        if not self.idle():
+            return None
+        now = self.clock()
+        if self._last_render is not None and now - self._last_render < self.min_interval:
+            return None
+        category = self.next_category()
+        if category is None:
+            return None
+        if self.cache.size() >= self.max_bytes and not self._make_room(category):
+            return None
+
+        # Count failed requests too, so errors don't bypass the rate limit
+        self._last_render = now
+        prompt = prompts.compose_prompt(category, self.rng)
+        self.cache.put(category, self.render(prompt), prompt)
+        return category
+
+    def run(self, stop=None, poll_interval=1.0):
+        while stop is None or not stop():
+            try:
+                category = self.step()
+            except Exception as e:
+                print('Warm-up render failed: ' + str(e))
+            else:
+                if category is not None:
+                    print('Warmed up ' + category + ', stock: '
+                          + str(self.cache.stock()))
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--stock', type=int, default=8,
+                        help='images to keep ready across all categories')
+    parser.add_argument('--max-mb', type=float, default=100,
+                        help='disk budget of the cache in MB')
+    parser.add_argument('--interval', type=float, default=60,
+                        help='seconds between two render requests')
+    parser.add_argument('--idle', type=float, default=30,
+                        help='seconds without a job before rendering')
+    parser.add_argument('--once', action='store_true',
+                        help='render at most one image and exit')
+    args = parser.parse_args()
+
+    scheduler = WarmupScheduler(ImageCache(), stock_size=args.stock,
+                                max_bytes=int(args.max_mb * 2**20),
+                                min_interval=args.interval,
+                                idle_after=args.idle)
+    if args.once:
+        print(scheduler.step())
+    else:
+        print('Warming up the image cache, press Ctrl-C to stop.')
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            print('Closing!')